@@ -5,14 +5,17 @@ Run with:
 Then open http://localhost:8000
 """
 
-from wsgiref.simple_server import make_server
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, make_server
+import calendar
 import os
 import mimetypes
 import http.cookies as Cookie
+from urllib.parse import parse_qs
 
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
-from . import auth, db
+from . import auth, branches, compress, db, events, forecast, jobs, profiling, ratelimit, search
 
 TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "..", "templates")
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "static")
@@ -33,6 +36,15 @@ def redirect(start_response, location):
     return [b""]
 
 
+def enqueue_job(name, payload, **kwargs):
+    """Queue background work; a queue failure must never fail the request."""
+    try:
+        return jobs.enqueue(name, payload, **kwargs)
+    except Exception as e:
+        print(f"[JOBS] Could not enqueue {name}:", e)
+        return None
+
+
 def serve_static(environ, start_response, rel_path):
     file_path = os.path.join(STATIC_DIR, rel_path.lstrip("/"))
     if not os.path.isfile(file_path):
@@ -122,13 +134,21 @@ def dashboard(environ, start_response, session):
     user_id = session.get("user_id")
 
     if role == "ADMIN":
+        branch_id = branches.session_branch(session)
         stats = {
             "customers": db.query_one("SELECT COUNT(*) AS c FROM customers") or {"c": 0},
-            "mechanics": db.query_one("SELECT COUNT(*) AS c FROM mechanics") or {"c": 0},
+            "mechanics": db.query_one("SELECT COUNT(*) AS c FROM mechanics WHERE branch_id=%s", (branch_id,)) or {"c": 0},
             "vehicles": db.query_one("SELECT COUNT(*) AS c FROM vehicles") or {"c": 0},
-            "bookings": db.query_one("SELECT COUNT(*) AS c FROM bookings") or {"c": 0},
+            "bookings": db.query_one("SELECT COUNT(*) AS c FROM bookings WHERE branch_id=%s", (branch_id,)) or {"c": 0},
         }
-        body = render_template("admin_dashboard.html", session=session, stats=stats)
+        body = render_template(
+            "admin_dashboard.html",
+            session=session,
+            stats=stats,
+            compression=application.stats(),
+            statements=db.statement_stats(),
+            replicas=db.replica_status(),
+        )
     elif role == "CUSTOMER":
         sql = """SELECT b.*, s.service_name, v.vehicle_number
                  FROM bookings b
@@ -137,7 +157,10 @@ def dashboard(environ, start_response, session):
                  JOIN customers c ON b.customer_id = c.customer_id
                  WHERE c.user_id=%s
                  ORDER BY b.booking_date DESC"""
-        bookings = db.query_all(sql, (user_id,))
+        # A customer's bookings can be at any branch
+        bookings = branches.query_all_databases(
+            sql, (user_id,), sort_key=lambda b: b["booking_date"], reverse=True
+        )
         body = render_template("customer_dashboard.html", session=session, bookings=bookings)
     elif role == "MECHANIC":
         sql = """SELECT b.*, s.service_name, v.vehicle_number
@@ -188,6 +211,8 @@ def admin_slots(environ, start_response, session):
     if not session or session.get("role") != "ADMIN":
         return redirect(start_response, "/login")
 
+    branch_id = branches.session_branch(session)
+
     if environ["REQUEST_METHOD"] == "POST":
         form = auth.parse_post(environ)
         slot_date = form.get("slot_date", "").strip()
@@ -198,14 +223,62 @@ def admin_slots(environ, start_response, session):
         if slot_date and start_time and end_time:
             try:
                 db.execute(
-                    "INSERT INTO time_slots (slot_date, start_time, end_time, max_bookings) VALUES (%s,%s,%s,%s)",
-                    (slot_date, start_time, end_time, max_bookings),
+                    "INSERT INTO time_slots (slot_date, start_time, end_time, max_bookings, branch_id) VALUES (%s,%s,%s,%s,%s)",
+                    (slot_date, start_time, end_time, max_bookings, branch_id),
                 )
             except Exception as e:
                 print("[ADMIN SLOTS] Error:", e)
 
-    slots = db.query_all("SELECT * FROM time_slots ORDER BY slot_date, start_time")
-    body = render_template("admin_slots.html", session=session, slots=slots)
+    slots = db.query_all(
+        "SELECT * FROM time_slots WHERE branch_id=%s ORDER BY slot_date, start_time", (branch_id,)
+    )
+
+    # Capacity suggestions (None when NumPy is not installed)
+    suggestions = forecast.safe(forecast.slot_suggestions, slots, branch_id) or {}
+    backtest = forecast.safe(forecast.backtest, branch_id=branch_id)
+    mechanic_load = []
+    load = forecast.safe(forecast.mechanic_load, branch_id=branch_id)
+    if load is not None:
+        names = {m["mechanic_id"]: m["full_name"]
+                 for m in db.query_all("SELECT mechanic_id, full_name FROM mechanics WHERE branch_id=%s", (branch_id,))}
+        ids, dates, jobs_per_day, utilisation = load
+        for i, mechanic_id in enumerate(ids.tolist()):
+            if mechanic_id not in names:
+                continue
+            peak = int(utilisation[i].argmax())
+            mechanic_load.append({
+                "name": names.get(mechanic_id, f"#{mechanic_id}"),
+                "avg_jobs": float(jobs_per_day[i].mean()),
+                "avg_utilisation": float(utilisation[i].mean()),
+                "peak_date": dates[peak],
+                "peak_utilisation": float(utilisation[i][peak]),
+            })
+
+    service_demand = []
+    by_service = forecast.safe(forecast.demand_by_service, branch_id=branch_id)
+    if by_service is not None:
+        names = {s["service_id"]: s["service_name"]
+                 for s in db.query_all("SELECT service_id, service_name FROM services")}
+        ids, rates = by_service
+        for i, service_id in enumerate(ids.tolist()):
+            weekday, hour = divmod(int(rates[i].argmax()), forecast.HOURS)
+            service_demand.append({
+                "name": names.get(service_id, f"#{service_id}"),
+                "per_week": float(rates[i].sum()),
+                "peak": f"{calendar.day_abbr[weekday]} {hour:02d}:00",
+                "peak_rate": float(rates[i].max()),
+            })
+        service_demand.sort(key=lambda d: d["per_week"], reverse=True)
+
+    body = render_template(
+        "admin_slots.html",
+        session=session,
+        slots=slots,
+        suggestions=suggestions,
+        backtest=backtest,
+        mechanic_load=mechanic_load,
+        service_demand=service_demand,
+    )
     start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
     return [body]
 
@@ -213,6 +286,8 @@ def admin_bookings(environ, start_response, session):
     if not session or session.get("role") != "ADMIN":
         return redirect(start_response, "/login")
 
+    branch_id = branches.session_branch(session)
+
     # Handle status / mechanic update
     if environ["REQUEST_METHOD"] == "POST":
         form = auth.parse_post(environ)
@@ -222,15 +297,17 @@ def admin_bookings(environ, start_response, session):
 
         if mechanic_id:
             db.execute(
-                "UPDATE bookings SET assigned_mechanic_id=%s WHERE booking_id=%s",
-                (mechanic_id, booking_id),
+                "UPDATE bookings SET assigned_mechanic_id=%s WHERE booking_id=%s AND branch_id=%s",
+                (mechanic_id, booking_id, branch_id),
             )
 
         if status:
-            db.execute(
-                "UPDATE bookings SET current_status=%s WHERE booking_id=%s",
-                (status, booking_id),
+            updated = db.execute_rowcount(
+                "UPDATE bookings SET current_status=%s WHERE booking_id=%s AND branch_id=%s",
+                (status, booking_id, branch_id),
             )
+            if updated:
+                events.record(booking_id, status, session)
 
     sql = """
         SELECT b.*, s.service_name, v.vehicle_number, c.full_name AS customer_name,
@@ -242,10 +319,14 @@ def admin_bookings(environ, start_response, session):
         JOIN customers c ON b.customer_id = c.customer_id
         JOIN time_slots t ON b.slot_id = t.slot_id
         LEFT JOIN mechanics m ON b.assigned_mechanic_id = m.mechanic_id
+        WHERE b.branch_id = %s
         ORDER BY b.booking_date DESC
     """
-    bookings = db.query_all(sql)
-    mechanics = db.query_all("SELECT mechanic_id, full_name FROM mechanics")
+    # Long listings use tuple-backed rows to keep memory per row small
+    bookings = db.query_all(sql, (branch_id,), compact=True)
+    mechanics = db.query_all(
+        "SELECT mechanic_id, full_name FROM mechanics WHERE branch_id=%s AND is_active=1", (branch_id,)
+    )
 
     body = render_template(
         "admin_bookings.html",
@@ -260,6 +341,7 @@ def admin_mechanics(environ, start_response, session):
     if not session or session.get("role") != "ADMIN":
         return redirect(start_response, "/login")
 
+    branch_id = branches.session_branch(session)
     message = None
 
     if environ["REQUEST_METHOD"] == "POST":
@@ -276,7 +358,7 @@ def admin_mechanics(environ, start_response, session):
             if full_name and email and phone and password:
                 # Check duplicate email
                 existing = db.query_one(
-                    "SELECT user_id FROM users WHERE email=%s", (email,)
+                    "SELECT user_id FROM users WHERE email=%s", (email,), primary=True
                 )
                 if existing:
                     message = "Email already exists."
@@ -287,8 +369,8 @@ def admin_mechanics(environ, start_response, session):
                         (email, pwd_hash),
                     )
                     db.execute(
-                        "INSERT INTO mechanics (user_id, full_name, phone, specialization, is_active) VALUES (%s,%s,%s,%s,1)",
-                        (user_id, full_name, phone, specialization),
+                        "INSERT INTO mechanics (user_id, full_name, phone, specialization, is_active, branch_id) VALUES (%s,%s,%s,%s,1,%s)",
+                        (user_id, full_name, phone, specialization, branch_id),
                     )
                     message = "Mechanic added."
             else:
@@ -299,13 +381,14 @@ def admin_mechanics(environ, start_response, session):
             new_status = form.get("new_status")
             if mechanic_id and new_status is not None:
                 db.execute(
-                    "UPDATE mechanics SET is_active=%s WHERE mechanic_id=%s",
-                    (new_status, mechanic_id),
+                    "UPDATE mechanics SET is_active=%s WHERE mechanic_id=%s AND branch_id=%s",
+                    (new_status, mechanic_id, branch_id),
                 )
                 message = "Status updated."
 
     mechanics = db.query_all(
-        "SELECT m.*, u.email FROM mechanics m JOIN users u ON m.user_id=u.user_id ORDER BY m.mechanic_id DESC"
+        "SELECT m.*, u.email FROM mechanics m JOIN users u ON m.user_id=u.user_id WHERE m.branch_id=%s ORDER BY m.mechanic_id DESC",
+        (branch_id,),
     )
 
     body = render_template(
@@ -321,6 +404,7 @@ def admin_payments(environ, start_response, session):
     if not session or session.get("role") != "ADMIN":
         return redirect(start_response, "/login")
 
+    branch_id = branches.session_branch(session)
     message = None
 
     if environ["REQUEST_METHOD"] == "POST":
@@ -332,10 +416,15 @@ def admin_payments(environ, start_response, session):
         txref = form.get("transaction_ref", "").strip()
 
         if booking_id and amount and mode and status:
-            db.execute(
+            payment_id = db.execute(
                 "INSERT INTO payments (booking_id, amount, payment_mode, payment_status, transaction_ref) VALUES (%s,%s,%s,%s,%s)",
                 (booking_id, amount, mode, status, txref),
             )
+            enqueue_job(
+                "payment_receipt",
+                {"payment_id": payment_id, "branch_id": branch_id},
+                idempotency_key=f"payment_receipt:{branch_id}:{payment_id}",
+            )
             message = "Payment recorded."
         else:
             message = "Please fill all required fields."
@@ -347,8 +436,18 @@ def admin_payments(environ, start_response, session):
         JOIN bookings b ON p.booking_id = b.booking_id
         JOIN customers c ON b.customer_id = c.customer_id
         JOIN services s ON b.service_id = s.service_id
-        ORDER BY p.payment_date DESC
-        """
+        WHERE b.branch_id = %s
+        UNION ALL
+        SELECT p.*, c.full_name AS customer_name, s.service_name, b.booking_date
+        FROM payments_archive p
+        JOIN bookings_archive b ON p.booking_id = b.booking_id
+        JOIN customers c ON b.customer_id = c.customer_id
+        JOIN services s ON b.service_id = s.service_id
+        WHERE b.branch_id = %s
+        ORDER BY payment_date DESC
+        """,
+        (branch_id, branch_id),
+        compact=True,
     )
 
     bookings = db.query_all(
@@ -357,8 +456,10 @@ def admin_payments(environ, start_response, session):
         FROM bookings b
         JOIN customers c ON b.customer_id = c.customer_id
         JOIN services s ON b.service_id = s.service_id
+        WHERE b.branch_id = %s
         ORDER BY b.booking_id DESC
-        """
+        """,
+        (branch_id,),
     )
 
     body = render_template(
@@ -374,6 +475,7 @@ def admin_feedback(environ, start_response, session):
     if not session or session.get("role") != "ADMIN":
         return redirect(start_response, "/login")
 
+    branch_id = branches.session_branch(session)
     sql = """
         SELECT f.*, c.full_name AS customer_name,
                s.service_name, b.booking_date
@@ -381,9 +483,18 @@ def admin_feedback(environ, start_response, session):
         JOIN bookings b ON f.booking_id = b.booking_id
         JOIN customers c ON f.customer_id = c.customer_id
         JOIN services s ON b.service_id = s.service_id
-        ORDER BY f.created_at DESC
+        WHERE b.branch_id = %s
+        UNION ALL
+        SELECT f.*, c.full_name AS customer_name,
+               s.service_name, b.booking_date
+        FROM feedback_archive f
+        JOIN bookings_archive b ON f.booking_id = b.booking_id
+        JOIN customers c ON f.customer_id = c.customer_id
+        JOIN services s ON b.service_id = s.service_id
+        WHERE b.branch_id = %s
+        ORDER BY created_at DESC
     """
-    feedback_list = db.query_all(sql)
+    feedback_list = db.query_all(sql, (branch_id, branch_id), compact=True)
 
     body = render_template(
         "admin_feedback.html",
@@ -394,7 +505,148 @@ def admin_feedback(environ, start_response, session):
     return [body]
 
 
+def admin_branches(environ, start_response, session):
+    if not session or session.get("role") != "ADMIN":
+        return redirect(start_response, "/login")
+
+    message = None
+
+    if environ["REQUEST_METHOD"] == "POST":
+        form = auth.parse_post(environ)
+        action = form.get("action", "add")
+        if action == "add":
+            name = form.get("branch_name", "").strip()
+            city = form.get("city", "").strip() or None
+            if name:
+                branch_id = db.execute(
+                    "INSERT INTO branches (branch_name, city, is_active) VALUES (%s,%s,1)",
+                    (name, city),
+                )
+                message = f"Branch #{branch_id} added."
+            else:
+                message = "Please enter a branch name."
+        elif action == "select":
+            if branches.select_branch(session, form.get("branch_id", "")):
+                return redirect(start_response, "/dashboard")
+            message = "Unknown branch."
+
+    summary, total = branches.summary()
+    body = render_template(
+        "admin_branches.html",
+        session=session,
+        summary=summary,
+        total=total,
+        current_branch=branches.session_branch(session),
+        message=message,
+    )
+    start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
+    return [body]
+
+
+def admin_search(environ, start_response, session):
+    if not session or session.get("role") != "ADMIN":
+        return redirect(start_response, "/login")
 
+    query = parse_qs(environ.get("QUERY_STRING", "")).get("q", [""])[0].strip()
+    results = search.search(query) if query else []
+    open_bookings = search.open_bookings_for(
+        [r["vehicle_id"] for r in results if r["kind"] == "VEHICLE"]
+    )
+
+    body = render_template(
+        "admin_search.html",
+        session=session,
+        query=query,
+        results=results,
+        open_bookings=open_bookings,
+    )
+    start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
+    return [body]
+
+
+def admin_turnaround(environ, start_response, session):
+    if not session or session.get("role") != "ADMIN":
+        return redirect(start_response, "/login")
+
+    query = parse_qs(environ.get("QUERY_STRING", ""))
+    group_by = query.get("by", ["service"])[0]
+    if group_by not in ("service", "mechanic"):
+        group_by = "service"
+    booking_id = query.get("booking_id", [""])[0].strip()
+
+    timeline = events.timeline(booking_id) if booking_id.isdigit() else None
+
+    body = render_template(
+        "admin_turnaround.html",
+        session=session,
+        group_by=group_by,
+        report_days=events.REPORT_DAYS,
+        turnaround=events.turnaround(group_by, branch_id=branches.session_branch(session)),
+        stages=events.stage_durations(group_by, branch_id=branches.session_branch(session)),
+        booking_id=booking_id,
+        timeline=timeline,
+    )
+    start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
+    return [body]
+
+
+def admin_profiles(environ, start_response, session):
+    if not session or session.get("role") != "ADMIN":
+        return redirect(start_response, "/login")
+
+    body = render_template(
+        "admin_profiles.html",
+        session=session,
+        profiles=profiling.list_profiles(),
+        sample_rates=profiling.SAMPLE_RATES,
+    )
+    start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
+    return [body]
+
+
+def admin_profile_download(environ, start_response, session):
+    if not session or session.get("role") != "ADMIN":
+        return redirect(start_response, "/login")
+
+    query = parse_qs(environ.get("QUERY_STRING", ""))
+    profile_id = query.get("id", [""])[0]
+    kind = query.get("kind", [""])[0]
+    file_path = profiling.profile_file(profile_id, kind)
+    if not file_path:
+        start_response("404 Not Found", [("Content-Type", "text/plain")])
+        return [b"Profile not found"]
+
+    with open(file_path, "rb") as f:
+        data = f.read()
+    start_response("200 OK", [
+        ("Content-Type", profiling.KINDS[kind]),
+        ("Content-Disposition", f'attachment; filename="{profile_id}.{kind}"'),
+    ])
+    return [data]
+
+
+def admin_jobs(environ, start_response, session):
+    if not session or session.get("role") != "ADMIN":
+        return redirect(start_response, "/login")
+
+    message = None
+
+    if environ["REQUEST_METHOD"] == "POST":
+        form = auth.parse_post(environ)
+        job_id = form.get("job_id")
+        if job_id:
+            jobs.retry_dead(job_id)
+            message = f"Job #{job_id} re-queued."
+
+    body = render_template(
+        "admin_jobs.html",
+        session=session,
+        stats=jobs.stats(),
+        dead=jobs.dead_jobs(),
+        message=message,
+    )
+    start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
+    return [body]
 
 
 # ---------- CUSTOMER VIEWS ----------
@@ -417,6 +669,7 @@ def customer_profile(environ, start_response, session):
                 "UPDATE customers SET full_name=%s, phone=%s, address=%s, city=%s WHERE customer_id=%s",
                 (full_name, phone, address, city, customer["customer_id"]),
             )
+            search.index_customer(customer["customer_id"], full_name, phone)
         customer = db.query_one("SELECT * FROM customers WHERE user_id=%s", (user_id,))
 
     body = render_template("customer_profile.html", session=session, customer=customer)
@@ -444,18 +697,23 @@ def customer_vehicles(environ, start_response, session):
             color = form.get("color", "").strip() or None
             if vehicle_number and customer_id:
                 try:
-                    db.execute(
+                    vehicle_id = db.execute(
                         """INSERT INTO vehicles
                             (customer_id, vehicle_number, brand, model, fuel_type, manufacture_year, color)
                             VALUES (%s,%s,%s,%s,%s,%s,%s)""",
                         (customer_id, vehicle_number, brand, model, fuel_type, year, color),
                     )
+                    search.index_vehicle(vehicle_id, vehicle_number)
                 except Exception as e:
                     print("[CUSTOMER VEHICLES] Error:", e)
         elif action == "delete":
             vid = form.get("vehicle_id", "")
             if vid:
-                db.execute("DELETE FROM vehicles WHERE vehicle_id=%s AND customer_id=%s", (vid, customer_id))
+                deleted = db.execute_rowcount(
+                    "DELETE FROM vehicles WHERE vehicle_id=%s AND customer_id=%s", (vid, customer_id)
+                )
+                if deleted:
+                    search.remove("VEHICLE", vid)
 
     vehicles = db.query_all("SELECT * FROM vehicles WHERE customer_id=%s ORDER BY vehicle_id DESC", (customer_id,))
     body = render_template("customer_vehicles.html", session=session, vehicles=vehicles)
@@ -480,9 +738,12 @@ def customer_book(environ, start_response, session):
     customer = db.query_one("SELECT * FROM customers WHERE user_id=%s", (user_id,))
     customer_id = customer["customer_id"] if customer else None
 
+    branch_id = branches.requested_branch(environ)
     services = db.query_all("SELECT * FROM services WHERE is_active=1 ORDER BY service_name")
     vehicles = db.query_all("SELECT * FROM vehicles WHERE customer_id=%s ORDER BY vehicle_id", (customer_id,))
-    slots = db.query_all("SELECT * FROM time_slots ORDER BY slot_date, start_time")
+    slots = db.query_all(
+        "SELECT * FROM time_slots WHERE branch_id=%s ORDER BY slot_date, start_time", (branch_id,)
+    )
 
     message = None
 
@@ -496,11 +757,17 @@ def customer_book(environ, start_response, session):
             message = "Please select service, vehicle and time slot."
         else:
             # Check simple availability: count bookings for that slot
+            # Capacity check must not run on a lagging replica
             count_row = db.query_one(
                 "SELECT COUNT(*) AS c FROM bookings WHERE slot_id=%s",
                 (slot_id,),
+                primary=True,
+            )
+            max_row = db.query_one(
+                "SELECT max_bookings FROM time_slots WHERE slot_id=%s AND branch_id=%s",
+                (slot_id, branch_id),
+                primary=True,
             )
-            max_row = db.query_one("SELECT max_bookings FROM time_slots WHERE slot_id=%s", (slot_id,))
             if not max_row:
                 message = "Invalid slot."
             else:
@@ -509,17 +776,25 @@ def customer_book(environ, start_response, session):
                 if current >= max_bookings:
                     message = "Selected slot is full. Please choose another."
                 else:
-                    db.execute(
+                    booking_id = db.execute(
                         """INSERT INTO bookings
-                            (customer_id, vehicle_id, service_id, slot_id, current_status)
-                            VALUES (%s,%s,%s,%s,'BOOKED')""",
-                        (customer_id, vehicle_id, service_id, slot_id),
+                            (customer_id, vehicle_id, service_id, slot_id, current_status, branch_id)
+                            VALUES (%s,%s,%s,%s,'BOOKED',%s)""",
+                        (customer_id, vehicle_id, service_id, slot_id, branch_id),
+                    )
+                    events.record(booking_id, "BOOKED", session)
+                    enqueue_job(
+                        "booking_confirmation",
+                        {"booking_id": booking_id, "branch_id": branch_id},
+                        idempotency_key=f"booking_confirmation:{branch_id}:{booking_id}",
                     )
                     message = "Booking created successfully!"
 
     body = render_template(
         "customer_book.html",
         session=session,
+        branches=branches.list_branches(),
+        branch_id=branch_id,
         services=services,
         vehicles=vehicles,
         slots=slots,
@@ -533,15 +808,31 @@ def customer_bookings(environ, start_response, session):
     if not session or session.get("role") != "CUSTOMER":
         return redirect(start_response, "/login")
     user_id = session["user_id"]
-    sql = """SELECT b.*, s.service_name, v.vehicle_number, t.slot_date, t.start_time, t.end_time
+    # Full history: open bookings plus anything already moved to the archive
+    sql = """SELECT b.booking_id, b.booking_date, b.current_status, br.branch_name,
+                    s.service_name, v.vehicle_number, t.slot_date, t.start_time, t.end_time
              FROM bookings b
+             JOIN branches br ON b.branch_id = br.branch_id
              JOIN services s ON b.service_id = s.service_id
              JOIN vehicles v ON b.vehicle_id = v.vehicle_id
              JOIN customers c ON b.customer_id = c.customer_id
              JOIN time_slots t ON b.slot_id = t.slot_id
              WHERE c.user_id=%s
-             ORDER BY b.booking_date DESC"""
-    bookings = db.query_all(sql, (user_id,))
+             UNION ALL
+             SELECT b.booking_id, b.booking_date, b.current_status, br.branch_name,
+                    s.service_name, v.vehicle_number, t.slot_date, t.start_time, t.end_time
+             FROM bookings_archive b
+             JOIN branches br ON b.branch_id = br.branch_id
+             JOIN services s ON b.service_id = s.service_id
+             JOIN vehicles v ON b.vehicle_id = v.vehicle_id
+             JOIN customers c ON b.customer_id = c.customer_id
+             JOIN time_slots t ON b.slot_id = t.slot_id
+             WHERE c.user_id=%s
+             ORDER BY booking_date DESC"""
+    # A customer's bookings can be at any branch
+    bookings = branches.query_all_databases(
+        sql, (user_id, user_id), sort_key=lambda b: b["booking_date"], reverse=True
+    )
     body = render_template("customer_bookings.html", session=session, bookings=bookings)
     start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
     return [body]
@@ -559,28 +850,33 @@ def customer_feedback(environ, start_response, session):
 
     if environ["REQUEST_METHOD"] == "POST":
         form = auth.parse_post(environ)
-        booking_id = form.get("booking_id", "")
+        # Option values are "<branch_id>-<booking_id>": the feedback row must
+        # go to the database that holds the booking
+        branch_id, _, booking_id = form.get("booking_id", "").rpartition("-")
         rating = form.get("rating", "")
         comments = form.get("comments", "").strip()
         if booking_id and rating:
             try:
-                db.execute(
-                    "INSERT INTO feedback (booking_id, customer_id, rating, comments) VALUES (%s,%s,%s,%s)",
-                    (booking_id, customer_id, rating, comments),
-                )
+                with db.branch(int(branch_id) if branch_id.isdecimal() else None):
+                    db.execute(
+                        "INSERT INTO feedback (booking_id, customer_id, rating, comments) VALUES (%s,%s,%s,%s)",
+                        (booking_id, customer_id, rating, comments),
+                    )
                 message = "Feedback submitted."
             except Exception as e:
                 print("[FEEDBACK] Error:", e)
                 message = "Error saving feedback."
 
     # Show only completed/delivered bookings & join with services
-    sql = """SELECT b.booking_id, s.service_name, b.current_status
+    sql = """SELECT b.booking_id, b.branch_id, b.booking_date, s.service_name, b.current_status
              FROM bookings b
              JOIN services s ON b.service_id = s.service_id
              WHERE b.customer_id=%s
              AND b.current_status IN ('COMPLETED','DELIVERED')
              ORDER BY b.booking_date DESC"""
-    eligible = db.query_all(sql, (customer_id,))
+    eligible = branches.query_all_databases(
+        sql, (customer_id,), sort_key=lambda b: b["booking_date"], reverse=True
+    )
     body = render_template("customer_feedback.html", session=session, eligible=eligible, message=message)
     start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
     return [body]
@@ -618,10 +914,12 @@ def mechanic_tasks(environ, start_response, session):
         remarks = form.get("remarks", "").strip()
 
         if booking_id and status:
-            db.execute(
+            updated = db.execute_rowcount(
                 "UPDATE bookings SET current_status=%s, remarks=%s WHERE booking_id=%s AND assigned_mechanic_id=%s",
                 (status, remarks, booking_id, mechanic_id),
             )
+            if updated:
+                events.record(booking_id, status, session, remarks)
             message = "Task updated."
 
     # Load current tasks (Booked / In progress / Waiting for parts)
@@ -660,7 +958,7 @@ def mechanic_history(environ, start_response, session):
     mech = db.query_one("SELECT mechanic_id FROM mechanics WHERE user_id=%s", (user_id,))
     mechanic_id = mech["mechanic_id"] if mech else None
 
-    # Completed / delivered jobs + any feedback
+    # Completed / delivered jobs + any feedback, from hot and archived bookings
     sql = """
         SELECT b.booking_id, b.current_status, b.booking_date,
                s.service_name,
@@ -674,9 +972,22 @@ def mechanic_history(environ, start_response, session):
         LEFT JOIN feedback f ON f.booking_id = b.booking_id
         WHERE b.assigned_mechanic_id = %s
           AND b.current_status IN ('COMPLETED','DELIVERED')
-        ORDER BY b.booking_date DESC
+        UNION ALL
+        SELECT b.booking_id, b.current_status, b.booking_date,
+               s.service_name,
+               v.vehicle_number,
+               c.full_name AS customer_name,
+               f.rating, f.comments, f.created_at AS feedback_date
+        FROM bookings_archive b
+        JOIN services s ON b.service_id = s.service_id
+        JOIN vehicles v ON b.vehicle_id = v.vehicle_id
+        JOIN customers c ON b.customer_id = c.customer_id
+        LEFT JOIN feedback_archive f ON f.booking_id = b.booking_id
+        WHERE b.assigned_mechanic_id = %s
+          AND b.current_status IN ('COMPLETED','DELIVERED')
+        ORDER BY booking_date DESC
     """
-    history = db.query_all(sql, (mechanic_id,))
+    history = db.query_all(sql, (mechanic_id, mechanic_id))
 
     body = render_template(
         "mechanic_history.html",
@@ -690,16 +1001,47 @@ def mechanic_history(environ, start_response, session):
 
 
 
+def too_busy(start_response, status, retry_after, message):
+    start_response(status, [
+        ("Content-Type", "text/plain; charset=utf-8"),
+        ("Retry-After", str(retry_after)),
+    ])
+    return [message.encode("utf-8")]
+
+
 def app(environ, start_response):
     path = environ.get("PATH_INFO", "") or "/"
 
     session_id, session = auth.get_session(environ)
+    db.set_request_context(session_id or environ.get("REMOTE_ADDR"))
 
     # Static files
     if path.startswith("/static/"):
         rel = path[len("/static/"):]
         return serve_static(environ, start_response, rel)
 
+    # Admission control
+    retry_after = ratelimit.check_rate(environ, path, session)
+    if retry_after:
+        return too_busy(start_response, "429 Too Many Requests", retry_after,
+                        "Too many requests. Please try again shortly.")
+    limiter = ratelimit.acquire(path)
+    if limiter is False:
+        return too_busy(start_response, "503 Service Unavailable", 1,
+                        "Server is busy. Please try again shortly.")
+    try:
+        branch_id = branches.request_branch(environ, path, session)
+        with db.branch(branch_id if path in branches.ROUTED_PATHS else None):
+            if profiling.should_profile(environ, path, session):
+                return profiling.profile_request(route, environ, start_response, path, session)
+            return route(environ, start_response, path, session)
+    finally:
+        db.release_connections()
+        if limiter:
+            limiter.release()
+
+
+def route(environ, start_response, path, session):
     if path == "/":
         return home(environ, start_response, session)
     elif path == "/login":
@@ -723,6 +1065,18 @@ def app(environ, start_response):
         return admin_payments(environ, start_response, session)
     elif path == "/admin/feedback":
         return admin_feedback(environ, start_response, session)
+    elif path == "/admin/branches":
+        return admin_branches(environ, start_response, session)
+    elif path == "/admin/search":
+        return admin_search(environ, start_response, session)
+    elif path == "/admin/turnaround":
+        return admin_turnaround(environ, start_response, session)
+    elif path == "/admin/profiles":
+        return admin_profiles(environ, start_response, session)
+    elif path == "/admin/profiles/download":
+        return admin_profile_download(environ, start_response, session)
+    elif path == "/admin/jobs":
+        return admin_jobs(environ, start_response, session)
 
 
 
@@ -758,9 +1112,49 @@ def app(environ, start_response):
 
 
 
+# What the server runs: the app behind gzip/deflate response compression
+application = compress.CompressionMiddleware(app, level=6, min_size=1024)
+
+
+SERVER_CONFIG = {
+    "port": 8000,
+    "workers": 32,    # request threads; they live for the whole run and reuse their DB connections
+}
+
+
+class PooledWSGIServer(WSGIServer):
+    """Hands each accepted request to a fixed pool of worker threads, so slow
+    pages don't block the others and the concurrency caps in
+    server/ratelimit.py have something to limit. Requests beyond the pool
+    wait in the executor's queue."""
+
+    request_queue_size = 128    # listen backlog; the default of 5 drops connections in bursts
+
+    def server_activate(self):
+        super().server_activate()
+        self.executor = ThreadPoolExecutor(max_workers=SERVER_CONFIG["workers"], thread_name_prefix="http")
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        executor = getattr(self, "executor", None)
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
 def main():
-    port = 8000
-    with make_server("", port, app) as httpd:
+    port = SERVER_CONFIG["port"]
+    with make_server("", port, application, server_class=PooledWSGIServer) as httpd:
         print(f"Serving on http://localhost:{port} ...")
         httpd.serve_forever()
 
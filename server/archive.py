@@ -0,0 +1,132 @@
+"""Hot/cold archival of closed bookings.
+
+Moves DELIVERED / CANCELLED bookings older than a configurable age out of
+``bookings`` (and their ``payments`` / ``feedback`` rows) into the
+``*_archive`` tables, in small batches so no statement holds locks for long.
+
+Run one pass from the project root (e.g. nightly from cron / Task Scheduler):
+    python -m server.archive
+
+The pass covers the main database and every branch database in
+``db.BRANCH_DB_CONFIGS``.
+"""
+
+import sys
+import time
+
+from . import db
+
+ARCHIVE_CONFIG = {
+    "min_age_days": 90,      # only archive bookings closed longer ago than this
+    "batch_size": 500,       # bookings moved per transaction
+    "pause_seconds": 0.5,    # sleep between batches to let other writers in
+}
+
+CLOSED_STATUSES = ("DELIVERED", "CANCELLED")
+
+BOOKING_COLUMNS = (
+    "booking_id, customer_id, vehicle_id, service_id, slot_id, "
+    "assigned_mechanic_id, booking_date, current_status, remarks, branch_id"
+)
+PAYMENT_COLUMNS = (
+    "payment_id, booking_id, amount, payment_mode, payment_status, "
+    "payment_date, transaction_ref"
+)
+FEEDBACK_COLUMNS = "feedback_id, booking_id, customer_id, rating, comments, created_at"
+
+
+def _placeholders(n):
+    return ",".join(["%s"] * n)
+
+
+def find_archivable(min_age_days, limit):
+    """Return up to ``limit`` booking ids that have been closed for at least
+    ``min_age_days``.
+
+    The closing time is taken from the booking's status history: a booking
+    qualifies when none of its ``booking_events`` is newer than the cutoff.
+    Bookings closed before the history was recorded have no events and fall
+    back to their creation date.
+    """
+    rows = db.query_all(
+        """SELECT b.booking_id FROM bookings b
+           WHERE b.current_status IN (%s,%s)
+             AND b.booking_date < NOW() - INTERVAL %s DAY
+             AND NOT EXISTS (
+                 SELECT 1 FROM booking_events e
+                 WHERE e.booking_id = b.booking_id
+                   AND e.created_at >= NOW() - INTERVAL %s DAY)
+           ORDER BY b.booking_id
+           LIMIT %s""",
+        CLOSED_STATUSES + (min_age_days, min_age_days, limit),
+        primary=True,
+    )
+    return [r["booking_id"] for r in rows]
+
+
+def archive_batch(booking_ids):
+    """Copy one batch of bookings (plus payments/feedback) to the archive
+    tables and delete them from the hot tables in a single transaction."""
+    if not booking_ids:
+        return 0
+    ids = tuple(booking_ids)
+    marks = _placeholders(len(ids))
+    with db.transaction() as cur:
+        cur.execute(
+            f"INSERT INTO payments_archive ({PAYMENT_COLUMNS}) "
+            f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE booking_id IN ({marks})",
+            ids,
+        )
+        cur.execute(
+            f"INSERT INTO feedback_archive ({FEEDBACK_COLUMNS}) "
+            f"SELECT {FEEDBACK_COLUMNS} FROM feedback WHERE booking_id IN ({marks})",
+            ids,
+        )
+        cur.execute(
+            f"INSERT INTO bookings_archive ({BOOKING_COLUMNS}) "
+            f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE booking_id IN ({marks})",
+            ids,
+        )
+        cur.execute(f"DELETE FROM payments WHERE booking_id IN ({marks})", ids)
+        cur.execute(f"DELETE FROM feedback WHERE booking_id IN ({marks})", ids)
+        cur.execute(f"DELETE FROM bookings WHERE booking_id IN ({marks})", ids)
+    return len(ids)
+
+
+def run(min_age_days=None, batch_size=None, pause_seconds=None, max_batches=None):
+    """Archive closed bookings batch by batch until none are left.
+
+    Returns the total number of bookings moved.
+    """
+    min_age_days = ARCHIVE_CONFIG["min_age_days"] if min_age_days is None else min_age_days
+    batch_size = batch_size or ARCHIVE_CONFIG["batch_size"]
+    pause_seconds = ARCHIVE_CONFIG["pause_seconds"] if pause_seconds is None else pause_seconds
+
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = find_archivable(min_age_days, batch_size)
+        if not ids:
+            break
+        try:
+            moved += archive_batch(ids)
+        except Exception as e:
+            print("[ARCHIVE] Error while archiving batch:", e)
+            break
+        batches += 1
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause_seconds)
+    print(f"[ARCHIVE] Moved {moved} bookings in {batches} batches")
+    return moved
+
+
+def main():
+    min_age = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    for branch_id in [None] + db.routed_branches():
+        with db.branch(branch_id):
+            run(min_age_days=min_age)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ import os
 import http.cookies as Cookie
 from urllib.parse import parse_qs
 
-from . import db
+from . import db, search
 
 SESSIONS = {}
 
@@ -56,12 +56,22 @@ def destroy_session(environ, headers):
 
 
 def parse_post(environ):
+    # The body can only be read once; keep the parsed form for later callers
+    # (e.g. the rate limiter reads the login email before the view does).
+    if "carservice.form" in environ:
+        return environ["carservice.form"]
     try:
         size = int(environ.get("CONTENT_LENGTH", 0))
     except (ValueError, TypeError):
         size = 0
     body = environ["wsgi.input"].read(size).decode("utf-8")
-    return {k: v[0] for k, v in parse_qs(body).items()}
+    form = {k: v[0] for k, v in parse_qs(body).items()}
+    environ["carservice.form"] = form
+    return form
+
+
+def parse_query(environ):
+    return {k: v[0] for k, v in parse_qs(environ.get("QUERY_STRING", "")).items()}
 
 
 def login_user(email, password):
@@ -75,7 +85,7 @@ def login_user(email, password):
 
 
 def register_customer(full_name, email, phone, address, city, password):
-    existing = db.query_one("SELECT user_id FROM users WHERE email=%s", (email,))
+    existing = db.query_one("SELECT user_id FROM users WHERE email=%s", (email,), primary=True)
     if existing:
         return None, "Email already registered"
 
@@ -88,4 +98,5 @@ def register_customer(full_name, email, phone, address, city, password):
         "INSERT INTO customers (user_id, full_name, phone, address, city) VALUES (%s,%s,%s,%s,%s)",
         (user_id, full_name, phone, address, city),
     )
+    search.index_customer(customer_id, full_name, phone)
     return customer_id, None
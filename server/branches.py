@@ -0,0 +1,188 @@
+"""Branch (garage) helpers: which branch a request belongs to, and
+cross-branch queries that fan out to every branch in parallel.
+
+Branch-scoped views filter on ``branch_id`` so each garage only reads its
+own rows through the ``(branch_id, ...)`` indexes. Requests on the paths in
+``ROUTED_PATHS`` run inside ``db.branch(...)``, so a branch listed in
+``db.BRANCH_DB_CONFIGS`` is served from its own database.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from . import auth, db
+
+DEFAULT_BRANCH_ID = 1
+MAX_PARALLEL = 8
+
+ADMIN_BRANCH_PATHS = {
+    "/dashboard",
+    "/admin/slots",
+    "/admin/bookings",
+    "/admin/mechanics",
+    "/admin/payments",
+    "/admin/feedback",
+    "/admin/turnaround",
+}
+MECHANIC_BRANCH_PATHS = {"/dashboard", "/mechanic/tasks", "/mechanic/history"}
+
+# Paths whose queries touch only branch-owned rows (plus shared tables,
+# which every branch database carries a copy of)
+ROUTED_PATHS = {
+    "/dashboard",
+    "/admin/slots",
+    "/admin/bookings",
+    "/admin/payments",
+    "/admin/feedback",
+    "/admin/turnaround",
+    "/customer/book",
+    "/mechanic/tasks",
+    "/mechanic/history",
+}
+
+
+def list_branches(active_only=True):
+    with db.branch(None):
+        sql = "SELECT * FROM branches"
+        if active_only:
+            sql += " WHERE is_active=1"
+        return db.query_all(sql + " ORDER BY branch_id")
+
+
+def get_branch(branch_id):
+    with db.branch(None):
+        return db.query_one("SELECT * FROM branches WHERE branch_id=%s", (branch_id,))
+
+
+def select_branch(session, branch_id):
+    """Make ``branch_id`` the admin's working branch for this session."""
+    branch = get_branch(branch_id)
+    if branch:
+        session["branch_id"] = branch["branch_id"]
+        session["branch_name"] = branch["branch_name"]
+    return branch
+
+
+def session_branch(session):
+    """The branch an admin is working in, or a mechanic belongs to."""
+    if "branch_id" not in session:
+        if session.get("role") == "MECHANIC":
+            with db.branch(None):
+                mech = db.query_one(
+                    "SELECT branch_id FROM mechanics WHERE user_id=%s", (session["user_id"],)
+                )
+            branch_id = mech["branch_id"] if mech else DEFAULT_BRANCH_ID
+        else:
+            branch_id = DEFAULT_BRANCH_ID
+        if not select_branch(session, branch_id):
+            session["branch_id"] = branch_id
+    return session["branch_id"]
+
+
+def requested_branch(environ):
+    """Branch a customer picked on the booking page (query string or form)."""
+    value = auth.parse_query(environ).get("branch_id", "")
+    if not value and environ["REQUEST_METHOD"] == "POST":
+        value = auth.parse_post(environ).get("branch_id", "")
+    return int(value) if value.isdecimal() else DEFAULT_BRANCH_ID
+
+
+def request_branch(environ, path, session):
+    """Branch whose data this request works on, or None if it spans branches."""
+    role = session.get("role") if session else None
+    if role == "ADMIN" and path in ADMIN_BRANCH_PATHS:
+        return session_branch(session)
+    if role == "MECHANIC" and path in MECHANIC_BRANCH_PATHS:
+        return session_branch(session)
+    if role == "CUSTOMER" and path == "/customer/book":
+        return requested_branch(environ)
+    return None
+
+
+def fan_out(func, branch_ids):
+    """Run ``func(branch_id)`` for every branch in parallel, each inside
+    ``db.branch(branch_id)``; returns {branch_id: result}."""
+    def run(branch_id):
+        with db.branch(branch_id):
+            return func(branch_id)
+
+    def run_in_worker(branch_id):
+        try:
+            return run(branch_id)
+        finally:
+            # The pool's threads end with this call; hand their connections
+            # back rather than leaving them to garbage collection
+            db.release_connections()
+
+    if len(branch_ids) <= 1:
+        return {b: run(b) for b in branch_ids}
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL, len(branch_ids))) as pool:
+        return dict(zip(branch_ids, pool.map(run_in_worker, branch_ids)))
+
+
+def query_all_databases(sql, params=None, sort_key=None, reverse=False):
+    """query_all() against the main database and every branch database,
+    merged. Used for customer-facing lists that span branches."""
+    routed = db.routed_branches()
+    if not routed:
+        with db.branch(None):
+            return db.query_all(sql, params)
+    results = fan_out(lambda _: db.query_all(sql, params), [None] + routed)
+    rows = [row for part in results.values() for row in part]
+    if sort_key:
+        rows.sort(key=sort_key, reverse=reverse)
+    return rows
+
+
+_SUMMARY_SQL = """
+    SELECT
+      (SELECT COUNT(*) FROM bookings
+        WHERE branch_id=%(b)s AND current_status IN ('BOOKED','IN_PROGRESS','WAITING_FOR_PARTS')) AS open_bookings,
+      (SELECT COUNT(*) FROM bookings
+        WHERE branch_id=%(b)s AND booking_date >= CURDATE()) AS booked_today,
+      (SELECT COALESCE(SUM(p.amount), 0) FROM payments p
+        JOIN bookings b ON p.booking_id = b.booking_id
+        WHERE b.branch_id=%(b)s AND p.payment_status='PAID'
+          AND p.payment_date >= CURDATE() - INTERVAL 30 DAY) AS revenue_30d,
+      (SELECT COUNT(*) FROM feedback f
+        JOIN bookings b ON f.booking_id = b.booking_id
+        WHERE b.branch_id=%(b)s) AS ratings,
+      (SELECT COALESCE(SUM(f.rating), 0) FROM feedback f
+        JOIN bookings b ON f.booking_id = b.booking_id
+        WHERE b.branch_id=%(b)s) AS rating_total,
+      (SELECT COUNT(*) FROM mechanics
+        WHERE branch_id=%(b)s AND is_active=1) AS active_mechanics,
+      (SELECT COALESCE(SUM(max_bookings), 0) FROM time_slots
+        WHERE branch_id=%(b)s AND slot_date BETWEEN CURDATE() AND CURDATE() + INTERVAL 6 DAY) AS capacity_7d,
+      (SELECT COUNT(*) FROM bookings b
+        JOIN time_slots t ON b.slot_id = t.slot_id
+        WHERE b.branch_id=%(b)s AND b.current_status <> 'CANCELLED'
+          AND t.slot_date BETWEEN CURDATE() AND CURDATE() + INTERVAL 6 DAY) AS booked_7d
+"""
+
+_SUMMED = ("open_bookings", "booked_today", "revenue_30d", "ratings", "rating_total",
+           "active_mechanics", "capacity_7d", "booked_7d")
+
+
+def _finish(row):
+    row["avg_rating"] = (float(row["rating_total"]) / row["ratings"]) if row["ratings"] else None
+    row["utilisation_7d"] = (row["booked_7d"] / row["capacity_7d"]) if row["capacity_7d"] else None
+    return row
+
+
+def summary():
+    """Per-branch KPIs queried in parallel, plus an all-branches total row."""
+    branches = list_branches()
+    results = fan_out(lambda b: db.query_one(_SUMMARY_SQL, {"b": b}),
+                      [b["branch_id"] for b in branches])
+    rows = []
+    total = {key: 0 for key in _SUMMED}
+    for branch in branches:
+        row = dict(results[branch["branch_id"]] or {key: 0 for key in _SUMMED})
+        row["branch_id"] = branch["branch_id"]
+        row["branch_name"] = branch["branch_name"]
+        row["city"] = branch["city"]
+        for key in _SUMMED:
+            total[key] += row[key] or 0
+        rows.append(_finish(row))
+    total["branch_name"] = "All branches"
+    return rows, _finish(total)
@@ -0,0 +1,204 @@
+"""gzip / deflate response compression as WSGI middleware.
+
+Wraps the application returned by ``server.app`` and compresses text
+responses when the client's Accept-Encoding allows it. Bodies are compressed
+chunk by chunk as the application yields them, so streamed responses work.
+Responses smaller than ``min_size``, already encoded, or of a
+non-compressible type (images, downloads) are passed through unchanged.
+
+When many responses are being compressed at once the middleware drops to a
+cheaper compression level so CPU time does not turn into queueing latency.
+"""
+
+import threading
+import time
+import zlib
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# zlib wbits: 16+ gives a gzip wrapper, plain 15 gives the zlib format that
+# HTTP calls "deflate"
+ENCODINGS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def negotiate(accept_encoding):
+    """Pick "gzip", "deflate" or None from an Accept-Encoding header."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+
+    best, best_q = None, 0.0
+    for name in ("gzip", "deflate"):
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _without(headers, *names):
+    names = {n.lower() for n in names}
+    return [(k, v) for k, v in headers if k.lower() not in names]
+
+
+def _add_vary(headers):
+    vary = _header(headers, "Vary")
+    if vary is None:
+        return headers + [("Vary", "Accept-Encoding")]
+    if "accept-encoding" in vary.lower() or vary.strip() == "*":
+        return headers
+    return _without(headers, "Vary") + [("Vary", vary + ", Accept-Encoding")]
+
+
+class CompressionMiddleware:
+    def __init__(self, app, level=6, min_size=1024, busy_level=1, busy_threshold=8):
+        self.app = app
+        self.level = level
+        self.min_size = min_size
+        self.busy_level = busy_level
+        self.busy_threshold = busy_threshold
+        self.active = 0
+        self.lock = threading.Lock()
+        self.counters = {
+            "compressed": 0,
+            "skipped": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "cpu_seconds": 0.0,
+        }
+
+    def stats(self):
+        with self.lock:
+            snapshot = dict(self.counters)
+        snapshot["bytes_saved"] = snapshot["bytes_in"] - snapshot["bytes_out"]
+        return snapshot
+
+    def _count(self, **amounts):
+        with self.lock:
+            for key, amount in amounts.items():
+                self.counters[key] += amount
+
+    def __call__(self, environ, start_response):
+        encoding = None
+        if environ.get("REQUEST_METHOD") != "HEAD":
+            encoding = negotiate(environ.get("HTTP_ACCEPT_ENCODING", ""))
+
+        response = {}
+        written = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            if exc_info and response.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["status"] = status
+            response["headers"] = list(headers)
+            return written.append   # legacy write() output is emitted before the body
+
+        result = self.app(environ, capture_start_response)
+        return self._respond(result, written, response, start_response, encoding)
+
+    def _eligible(self, status, headers):
+        ctype = (_header(headers, "Content-Type") or "").lower()
+        if not ctype.startswith(COMPRESSIBLE_TYPES):
+            return False, False
+        code = status.split(" ", 1)[0]
+        if code in ("204", "304") or _header(headers, "Content-Encoding"):
+            return True, False
+        length = _header(headers, "Content-Length")
+        if length is not None and length.isdigit() and int(length) < self.min_size:
+            return True, False
+        return True, True
+
+    def _respond(self, result, written, response, start_response, encoding):
+        try:
+            chunks = iter(result)
+            buffered = list(written)
+            size = sum(len(c) for c in buffered)
+            if "status" not in response:
+                # The app may call start_response lazily, before its first chunk
+                for chunk in chunks:
+                    buffered.append(chunk)
+                    size += len(chunk)
+                    break
+
+            status, headers = response["status"], response["headers"]
+            varies, compress = self._eligible(status, headers)
+            if compress and encoding and _header(headers, "Content-Length") is None:
+                # Unknown length: buffer up to min_size before deciding
+                for chunk in chunks:
+                    buffered.append(chunk)
+                    size += len(chunk)
+                    if size >= self.min_size:
+                        break
+                else:
+                    compress = size >= self.min_size
+            if varies:
+                headers = _add_vary(headers)
+
+            if not (compress and encoding):
+                self._count(skipped=1)
+                response["sent"] = True
+                start_response(status, headers)
+                yield from buffered
+                yield from chunks
+                return
+
+            headers = _without(headers, "Content-Length") + [("Content-Encoding", encoding)]
+            response["sent"] = True
+            start_response(status, headers)
+            yield from self._compress(encoding, buffered, chunks)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    def _compress(self, encoding, buffered, chunks):
+        with self.lock:
+            self.active += 1
+            level = self.busy_level if self.active > self.busy_threshold else self.level
+        try:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+            bytes_in = bytes_out = 0
+            cpu = 0.0
+            for source in (buffered, chunks):
+                for chunk in source:
+                    if not chunk:
+                        continue
+                    started = time.thread_time()
+                    out = compressor.compress(chunk)
+                    cpu += time.thread_time() - started
+                    bytes_in += len(chunk)
+                    if out:
+                        bytes_out += len(out)
+                        yield out
+            started = time.thread_time()
+            out = compressor.flush()
+            cpu += time.thread_time() - started
+            bytes_out += len(out)
+            yield out
+            self._count(compressed=1, bytes_in=bytes_in, bytes_out=bytes_out, cpu_seconds=cpu)
+        finally:
+            with self.lock:
+                self.active -= 1
@@ -1,8 +1,15 @@
 """Database helper module for Car Service and Booking System."""
 
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, InterfaceError, OperationalError
 
+# Primary: every write (execute / transaction) goes here.
 DB_CONFIG = {
     "host": "localhost",
     "user": "root",
@@ -10,44 +17,594 @@ DB_CONFIG = {
     "database": "car_service_db",
 }
 
+# Read replicas used by query_one / query_all. Leave empty to send all
+# traffic to the primary. "weight" is optional (default 1).
+REPLICA_CONFIGS = [
+    # {"host": "localhost", "port": 3307, "user": "root", "password": "mysql",
+    #  "database": "car_service_db", "weight": 2},
+]
 
-def get_connection():
+# Optional: branches whose data lives in a database of their own, as
+# {branch_id: config like DB_CONFIG}. Shared tables (users, customers,
+# vehicles, services, mechanics, branches) must be replicated into each
+# of these; branches not listed use DB_CONFIG and REPLICA_CONFIGS.
+BRANCH_DB_CONFIGS = {}
+
+ROUTING_CONFIG = {
+    "read_your_writes_seconds": 5,   # pin a session's reads to the primary after it writes
+    "replica_retry_seconds": 30,     # how long a failed replica is skipped
+    "connect_timeout": 2,            # seconds, replicas only; keeps failover fast
+    "health_check_seconds": 10,      # how often replicas are pinged and their lag read
+    "max_lag_seconds": 30,           # replicas further behind the primary get no reads
+}
+
+CONNECTION_CONFIG = {
+    "reuse": True,                 # return connections to a shared pool instead of closing them
+    "pool_size": 32,               # idle connections kept per database; matches SERVER_CONFIG["workers"] in app.py
+    "max_idle_seconds": 300,       # ping a reused connection idle longer than this before using it
+    "prepared_statements": True,   # run parameterised statements as server-side prepared statements
+    "statement_cache_size": 64,    # prepared statements kept per connection (least recently used go first)
+    "row_mode": "dict",            # "dict" or "compact" (tuple-backed Row objects, see Row)
+}
+
+_local = threading.local()
+_lock = threading.Lock()
+_recent_writes = {}        # pin key -> monotonic time until which reads use the primary
+_replica_down_until = {}   # replica index -> monotonic time it may be retried
+_replica_health = {}       # replica index -> (ok, lag seconds or None, error) from the last check
+_health_thread = None
+_statement_stats = {"prepared": 0, "reused": 0, "evicted": 0}
+_pool = {}                 # (kind, id) -> idle _Handles, most recently released last
+_pool_lock = threading.Lock()
+
+
+def set_request_context(pin_key):
+    """Tell the router whose request is running on this thread.
+
+    ``pin_key`` identifies the user (session id, or client address when not
+    logged in); reads for that key stay on the primary for a short window
+    after any write so users always see what they just saved.
+    """
+    _local.pin_key = pin_key
+
+
+@contextmanager
+def branch(branch_id):
+    """Route this thread's queries to ``branch_id``'s database (if it has one)
+    for the duration of the block."""
+    previous = getattr(_local, "branch_id", None)
+    _local.branch_id = branch_id
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        yield
+    finally:
+        _local.branch_id = previous
+
+
+def current_branch():
+    return getattr(_local, "branch_id", None)
+
+
+def routed_branches():
+    """Branch ids that have a database of their own."""
+    return list(BRANCH_DB_CONFIGS)
+
+
+def database_key():
+    """Identifies the database the current thread's queries go to."""
+    branch_id = current_branch()
+    return branch_id if branch_id in BRANCH_DB_CONFIGS else None
+
+
+def _pin_key():
+    key = getattr(_local, "pin_key", None)
+    return key if key is not None else ("thread", threading.get_ident())
+
+
+def _note_write():
+    now = time.monotonic()
+    with _lock:
+        _recent_writes[_pin_key()] = now + ROUTING_CONFIG["read_your_writes_seconds"]
+        if len(_recent_writes) > 10000:
+            for key in [k for k, until in _recent_writes.items() if until <= now]:
+                del _recent_writes[key]
+
+
+def _reads_pinned():
+    until = _recent_writes.get(_pin_key())
+    return until is not None and until > time.monotonic()
+
+
+def _connect(config, **extra):
+    params = {k: v for k, v in config.items() if k != "weight"}
+    params.update(extra)
+    return mysql.connector.connect(**params)
+
+
+def _open_fresh(key, config, **extra):
+    return _connect(config, **extra)
+
+
+def _open_primary(opener):
+    branch_db = database_key()
+    try:
+        return opener(("primary", branch_db), BRANCH_DB_CONFIGS.get(branch_db, DB_CONFIG))
     except Error as e:
         print("[DB] Error while connecting to MySQL:", e)
         raise
 
 
-def query_one(sql, params=None):
-    conn = get_connection()
+def _open_read(opener):
+    if not REPLICA_CONFIGS or _reads_pinned() or database_key() is not None:
+        return _open_primary(opener)
+    _start_health_checks()
+
+    candidates = _healthy_replicas()
+    while candidates:
+        weights = [cfg.get("weight", 1) for _, cfg in candidates]
+        idx, cfg = random.choices(candidates, weights=weights)[0]
+        try:
+            return opener(("replica", idx), cfg, connection_timeout=ROUTING_CONFIG["connect_timeout"])
+        except Error as e:
+            print(f"[DB] Replica {cfg.get('host')}:{cfg.get('port', 3306)} unavailable:", e)
+            _replica_down_until[idx] = time.monotonic() + ROUTING_CONFIG["replica_retry_seconds"]
+            candidates = [c for c in candidates if c[0] != idx]
+    return _open_primary(opener)
+
+
+def get_connection():
+    """New connection to the primary (of the current branch's database).
+    The caller closes it."""
+    return _open_primary(_open_fresh)
+
+
+def _healthy_replicas():
+    now = time.monotonic()
+    return [
+        (i, cfg) for i, cfg in enumerate(REPLICA_CONFIGS)
+        if _replica_down_until.get(i, 0) <= now and _replica_health.get(i, (True,))[0]
+    ]
+
+
+def _replica_lag(cur):
+    """Seconds behind the primary; None if the server is not replicating
+    (e.g. a plain copy) or the user may not read replication status.
+    Raises LookupError if replication is configured but stopped."""
+    for sql, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                        ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+        try:
+            cur.execute(sql)
+            rows = cur.fetchall()
+        except Error:
+            continue
+        if not rows:
+            return None
+        lag = rows[0].get(column)
+        if lag is None:
+            raise LookupError("replication is not running")
+        return lag
+    return None
+
+
+def check_replicas():
+    """Ping every replica and read its replication lag. Unreachable,
+    stopped or lagging replicas get no reads until a later check passes."""
+    for i, cfg in enumerate(REPLICA_CONFIGS):
+        lag = None
+        try:
+            conn = _connect(cfg, connection_timeout=ROUTING_CONFIG["connect_timeout"])
+            try:
+                cur = conn.cursor(dictionary=True)
+                cur.execute("SELECT 1")
+                cur.fetchall()
+                lag = _replica_lag(cur)
+            finally:
+                conn.close()
+            if lag is not None and lag > ROUTING_CONFIG["max_lag_seconds"]:
+                raise LookupError(f"{lag}s behind the primary")
+            _replica_health[i] = (True, lag, None)
+        except (Error, LookupError) as e:
+            if _replica_health.get(i, (True,))[0]:
+                print(f"[DB] Replica {cfg.get('host')}:{cfg.get('port', 3306)} unhealthy:", e)
+            _replica_health[i] = (False, lag, str(e))
+
+
+def _health_loop():
+    while True:
+        try:
+            check_replicas()
+        except Exception as e:
+            print("[DB] Error while checking replicas:", e)
+        time.sleep(ROUTING_CONFIG["health_check_seconds"])
+
+
+def _start_health_checks():
+    global _health_thread
+    if _health_thread is None:
+        with _lock:
+            if _health_thread is None:
+                _health_thread = threading.Thread(target=_health_loop, name="replica-health", daemon=True)
+                _health_thread.start()
+
+
+def get_read_connection():
+    """New connection for a read: a healthy replica picked by weight, falling
+    back to the primary when none is available or reads are pinned.
+    Branch databases have no replicas."""
+    return _open_read(_open_fresh)
+
+
+def replica_status():
+    """One dict per configured replica: host, port, weight, whether it gets
+    reads, its lag at the last health check and the last error."""
+    now = time.monotonic()
+    status = []
+    for i, cfg in enumerate(REPLICA_CONFIGS):
+        ok, lag, error = _replica_health.get(i, (True, None, None))
+        status.append({
+            "host": cfg.get("host"),
+            "port": cfg.get("port", 3306),
+            "weight": cfg.get("weight", 1),
+            "is_up": ok and _replica_down_until.get(i, 0) <= now,
+            "lag": lag,
+            "error": error,
+        })
+    return status
+
+
+class StatementCache:
+    """Prepared-statement cursors of one connection, keyed by SQL text.
+
+    mysql.connector re-prepares a prepared cursor whenever it is given a
+    different SQL string object, so each statement keeps its own cursor and
+    is always executed with the cached key string. The least recently used
+    statement is closed on the server once ``size`` is exceeded.
+    """
+
+    def __init__(self, conn, size):
+        self.conn = conn
+        self.size = size
+        self.cursors = OrderedDict()
+
+    def get(self, sql):
+        entry = self.cursors.get(sql)
+        if entry is not None:
+            self.cursors.move_to_end(sql)
+            _count_statement("reused")
+            return entry
+        entry = (self.conn.cursor(prepared=True), sql)
+        self.cursors[sql] = entry
+        _count_statement("prepared")
+        while len(self.cursors) > self.size:
+            _, (old, _) = self.cursors.popitem(last=False)
+            _count_statement("evicted")
+            try:
+                old.close()
+            except Error:
+                pass
+        return entry
+
+
+def _count_statement(kind):
+    with _lock:
+        _statement_stats[kind] += 1
+
+
+def statement_stats():
+    """Prepared statements created, reused and evicted since start-up."""
+    with _lock:
+        return dict(_statement_stats)
+
+
+class _Handle:
+    """A connection checked out for one call, with its statement cache."""
+
+    def __init__(self, conn, key=None, pooled=False):
+        self.conn = conn
+        self.key = key
+        self.pooled = pooled
+        self.used_at = time.monotonic()
+        self.statements = None
+        if pooled and CONNECTION_CONFIG["prepared_statements"]:
+            self.statements = StatementCache(conn, CONNECTION_CONFIG["statement_cache_size"])
+
+    def cursor(self, sql, params):
+        """(cursor, sql) to run ``sql`` with: a cached prepared cursor for
+        positional parameters, a plain cursor otherwise (named parameters
+        would be rewritten on every call and never hit the cache)."""
+        if self.statements is not None and (params is None or isinstance(params, (tuple, list))):
+            return self.statements.get(sql)
+        return self.conn.cursor(), sql
+
+    def commit(self):
+        # Reused connections run in autocommit mode
+        if not self.pooled:
+            self.conn.commit()
+
+
+def _held():
+    """Pooled connections checked out by this thread, by database key."""
+    return _local.__dict__.setdefault("connections", {})
+
+
+def _open_pooled(key, config, **extra):
+    held = _held()
+    handle = held.get(key)
+    if handle is None:
+        with _pool_lock:
+            idle = _pool.get(key)
+            handle = idle.pop() if idle else None
+        if handle is not None and time.monotonic() - handle.used_at > CONNECTION_CONFIG["max_idle_seconds"]:
+            try:
+                handle.conn.ping(reconnect=False)
+            except Error:
+                _close(handle)
+                handle = None
+        if handle is None:
+            handle = _Handle(_connect(config, autocommit=True, **extra), key, pooled=True)
+        held[key] = handle
+    handle.used_at = time.monotonic()
+    return handle
+
+
+def _close(handle):
     try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute(sql, params or ())
-        row = cur.fetchone()
-        return row
-    finally:
-        conn.close()
+        handle.conn.close()
+    except Error:
+        pass
+
+
+def _discard(handle):
+    _held().pop(handle.key, None)
+    _close(handle)
+
+
+def release_connections():
+    """Give this thread's connections back to the shared pool (with their
+    prepared statements). Called when a request or background task ends;
+    connections beyond ``pool_size`` idle per database are closed."""
+    held = _held()
+    handles = list(held.values())
+    held.clear()
+    for handle in handles:
+        handle.used_at = time.monotonic()
+        with _pool_lock:
+            idle = _pool.setdefault(handle.key, [])
+            if len(idle) < CONNECTION_CONFIG["pool_size"]:
+                idle.append(handle)
+                handle = None
+        if handle is not None:
+            _close(handle)
+
+
+@contextmanager
+def _checkout(read=False):
+    """Connection for one call: the connection this thread already holds for
+    the target database, else one from the shared pool (kept until
+    release_connections()), or a new one closed afterwards when reuse is off."""
+    if not CONNECTION_CONFIG["reuse"]:
+        conn = get_read_connection() if read else get_connection()
+        try:
+            yield _Handle(conn)
+        finally:
+            conn.close()
+        return
+
+    handle = _open_read(_open_pooled) if read else _open_primary(_open_pooled)
+    try:
+        yield handle
+    except (OperationalError, InterfaceError) as e:
+        # Lost connection: the next call opens a new one, and a replica is
+        # skipped for a while as if it had failed to connect
+        _discard(handle)
+        kind, idx = handle.key
+        if kind == "replica":
+            cfg = REPLICA_CONFIGS[idx]
+            print(f"[DB] Replica {cfg.get('host')}:{cfg.get('port', 3306)} lost:", e)
+            _replica_down_until[idx] = time.monotonic() + ROUTING_CONFIG["replica_retry_seconds"]
+        raise
+
+
+def close_connections():
+    """Close this thread's connections instead of returning them to the pool."""
+    for handle in list(_held().values()):
+        _discard(handle)
+
+
+def close_pool():
+    """Close this thread's connections and every idle pooled connection."""
+    close_connections()
+    with _pool_lock:
+        handles = [h for idle in _pool.values() for h in idle]
+        _pool.clear()
+    for handle in handles:
+        _close(handle)
+
+
+class Row(tuple):
+    """Compact result row (``CONNECTION_CONFIG["row_mode"] = "compact"``).
+
+    A tuple of the column values that also reads like the dict rows:
+    ``row["name"]``, ``row.name``, ``row.get("name")``, ``keys()``,
+    ``items()`` and ``dict(row)`` all work, so templates and views need no
+    changes. Unlike a dict it is read-only and iterates over values; copy it
+    with ``dict(row)`` to modify it. One subclass is made per column list.
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        try:
+            return tuple.__getitem__(self, self._index[key])
+        except (KeyError, TypeError):
+            # Positions and slices index the tuple; unknown names raise KeyError
+            if isinstance(key, str):
+                raise KeyError(key) from None
+            return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name):
+        try:
+            return tuple.__getitem__(self, self._index[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, key):
+        return key in self._index
 
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
 
-def query_all(sql, params=None):
-    conn = get_connection()
+    def keys(self):
+        return self._fields
+
+    # _fields holds each column name once, so with duplicate names it is
+    # shorter than the tuple: pair names with values through _index.
+    def values(self):
+        return tuple(self[k] for k in self._fields)
+
+    def items(self):
+        return [(k, self[k]) for k in self._fields]
+
+    def __repr__(self):
+        return "Row(" + ", ".join(f"{k}={v!r}" for k, v in self.items()) + ")"
+
+
+_row_classes = {}
+
+
+def _row_class(fields):
+    cls = _row_classes.get(fields)
+    if cls is None:
+        # Later duplicates win, as they would in a dict row
+        index = {name: i for i, name in enumerate(fields)}
+        # namedtuple supplies fast attribute access per column; names it
+        # cannot take (and earlier duplicates) are renamed and only
+        # reachable as row["name"]. Row's own methods win over columns.
+        names = [name if index[name] == i else f"_{i}" for i, name in enumerate(fields)]
+        base = namedtuple("RowFields", names, rename=True)
+        attrs = {"__slots__": (), "_fields": tuple(index), "_index": index}
+        cls = _row_classes[fields] = type("Row", (Row, base), attrs)
+    return cls
+
+
+def _make_rows(cur, rows, compact):
+    if not rows:
+        return list(rows)
+    names = tuple(cur.column_names)
+    if compact is None:
+        compact = CONNECTION_CONFIG["row_mode"] == "compact"
+    if compact:
+        cls = _row_class(names)
+        new = tuple.__new__
+        return [new(cls, r) for r in rows]
+    return [dict(zip(names, r)) for r in rows]
+
+
+def start_trace():
+    """Record every statement run on this thread (with its duration) until
+    stop_trace() is called. Used by the request profiler."""
+    _local.trace = []
+
+
+def stop_trace():
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    return trace or []
+
+
+def _run(cur, sql, params, many=False):
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        if many:
+            cur.executemany(sql, params)
+        else:
+            cur.execute(sql, params or ())
+        return
+    start = time.perf_counter()
     try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute(sql, params or ())
-        rows = cur.fetchall()
-        return rows
+        if many:
+            cur.executemany(sql, params)
+        else:
+            cur.execute(sql, params or ())
     finally:
-        conn.close()
+        trace.append((" ".join(sql.split()), time.perf_counter() - start))
+
+
+def _read(sql, params, primary, compact, first=False):
+    # A reused connection may have died since its last use (replica down,
+    # server restarted); reads are safe to retry once on a fresh connection,
+    # which goes to another replica or the primary if a replica was lost
+    retries = 1 if CONNECTION_CONFIG["reuse"] else 0
+    while True:
+        try:
+            with _checkout(read=not primary) as handle:
+                cur, text = handle.cursor(sql, params)
+                _run(cur, text, params)
+                # Read the whole result so the connection is free for the next call
+                rows = cur.fetchall()
+                return _make_rows(cur, rows[:1] if first else rows, compact)
+        except (OperationalError, InterfaceError):
+            if not retries:
+                raise
+            retries -= 1
+
+
+def query_one(sql, params=None, primary=False, compact=None):
+    """First row of the result, or None. ``compact`` overrides the
+    configured row mode for this call."""
+    rows = _read(sql, params, primary, compact, first=True)
+    return rows[0] if rows else None
+
+
+def query_all(sql, params=None, primary=False, compact=None):
+    """All rows of the result. ``compact`` overrides the configured row mode
+    for this call."""
+    return _read(sql, params, primary, compact)
 
 
 def execute(sql, params=None):
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(sql, params or ())
-        conn.commit()
+    with _checkout() as handle:
+        cur, sql = handle.cursor(sql, params)
+        _run(cur, sql, params)
+        handle.commit()
+        _note_write()
         return cur.lastrowid
-    finally:
-        conn.close()
+
+
+def execute_rowcount(sql, params=None):
+    """Like execute() but returns the number of affected rows."""
+    with _checkout() as handle:
+        cur, sql = handle.cursor(sql, params)
+        _run(cur, sql, params)
+        handle.commit()
+        _note_write()
+        return cur.rowcount
+
+
+def execute_many(sql, seq_of_params):
+    """Run one statement for many parameter tuples in a single round trip
+    (multi-row INSERT) and commit."""
+    with transaction() as cur:
+        _run(cur, sql, seq_of_params, many=True)
+        return cur.rowcount
+
+
+@contextmanager
+def transaction():
+    """Run several statements on one connection and commit them together.
+
+    Yields a plain cursor; rolls back if the block raises.
+    """
+    with _checkout() as handle:
+        conn = handle.conn
+        conn.start_transaction()
+        try:
+            cur = conn.cursor()
+            yield cur
+            conn.commit()
+            _note_write()
+        except Exception:
+            conn.rollback()
+            raise
@@ -0,0 +1,130 @@
+"""Microbenchmark for the DB layer's row modes and prepared statements.
+
+Compares dict rows with compact ``db.Row`` rows (build time, allocated
+blocks and peak memory, measured with tracemalloc) on synthetic rows shaped
+like the admin bookings listing, so it runs without a database:
+
+    python -m server.dbbench [rows]
+
+With ``--db`` it also times a representative query against the configured
+database with prepared statements on and off, and in both row modes,
+returning the connection to the pool after every call like a request does:
+
+    python -m server.dbbench --db [calls]
+"""
+
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from . import db
+
+# Columns of the admin bookings listing (bookings.* plus joined names)
+COLUMNS = (
+    "booking_id", "customer_id", "vehicle_id", "service_id", "slot_id",
+    "booking_date", "current_status", "assigned_mechanic_id", "remarks",
+    "branch_id", "service_name", "vehicle_number", "customer_name",
+    "slot_date", "start_time", "end_time", "mechanic_name",
+)
+
+QUERY = """SELECT b.*, s.service_name, s.base_price, v.vehicle_number
+           FROM bookings b
+           JOIN services s ON b.service_id = s.service_id
+           JOIN vehicles v ON b.vehicle_id = v.vehicle_id
+           WHERE b.branch_id=%s
+           ORDER BY b.booking_date DESC
+           LIMIT %s"""
+
+
+class _Cursor:
+    """Stands in for a cursor: only column_names is read by _make_rows."""
+    column_names = COLUMNS
+
+
+def synthetic_rows(n):
+    start = datetime(2025, 1, 1, 9, 0)
+    return [
+        (i, i % 5000, i % 7000, i % 12, i % 900,
+         start + timedelta(minutes=i), "COMPLETED", i % 40 or None, None,
+         1 + i % 3, "General Service", f"MH-12-AB-{i % 10000:04d}", f"Customer {i % 5000}",
+         date(2025, 1, 1) + timedelta(days=i % 365), timedelta(hours=9 + i % 8),
+         timedelta(hours=10 + i % 8), f"Mechanic {i % 40}")
+        for i in range(n)
+    ]
+
+
+def measure(func):
+    """(result, seconds, allocated blocks, peak bytes) of one call."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = sum(s.count for s in tracemalloc.take_snapshot().statistics("filename"))
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    after = sum(s.count for s in tracemalloc.take_snapshot().statistics("filename"))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, after - before, peak
+
+
+def bench_rows(n):
+    raw = synthetic_rows(n)
+    print(f"[BENCH] {n} rows x {len(COLUMNS)} columns")
+    print(f"{'mode':<10}{'build ms':>10}{'blocks':>10}{'peak KB':>10}{'row[k] ms':>11}{'attr ms':>9}")
+    for mode, compact in (("dict", False), ("compact", True)):
+        rows, elapsed, blocks, peak = measure(lambda: db._make_rows(_Cursor, raw, compact))
+        started = time.perf_counter()
+        for r in rows:
+            r["booking_id"], r["customer_name"], r["remarks"]
+        by_key = time.perf_counter() - started
+        # What Jinja does for {{ r.customer_name }}
+        started = time.perf_counter()
+        for r in rows:
+            for name in ("booking_id", "customer_name", "remarks"):
+                try:
+                    getattr(r, name)
+                except AttributeError:
+                    r[name]
+        by_attr = time.perf_counter() - started
+        print(f"{mode:<10}{elapsed * 1000:>10.1f}{blocks:>10}{peak / 1024:>10.0f}"
+              f"{by_key * 1000:>11.1f}{by_attr * 1000:>9.1f}")
+        del rows
+
+
+def _time_queries(calls, limit):
+    started = time.perf_counter()
+    for _ in range(calls):
+        db.query_all(QUERY, (1, limit))
+        db.release_connections()    # as app() does at the end of each request
+    return (time.perf_counter() - started) / calls
+
+
+def bench_db(calls):
+    saved = dict(db.CONNECTION_CONFIG)
+    print(f"[BENCH] {calls} calls of the bookings listing query per setting")
+    print(f"{'prepared':<10}{'rows':<10}{'LIMIT 10 ms':>13}{'LIMIT 500 ms':>14}")
+    try:
+        for prepared in (False, True):
+            for mode in ("dict", "compact"):
+                db.close_pool()
+                db.CONNECTION_CONFIG.update(prepared_statements=prepared, row_mode=mode)
+                db.query_all(QUERY, (1, 1))     # connect (and prepare) outside the timing
+                small = _time_queries(calls, 10)
+                large = _time_queries(calls, 500)
+                print(f"{'yes' if prepared else 'no':<10}{mode:<10}{small * 1000:>13.2f}{large * 1000:>14.2f}")
+    finally:
+        db.CONNECTION_CONFIG.update(saved)
+        db.close_pool()
+    print(f"[BENCH] Statement cache: {db.statement_stats()}")
+
+
+def main(argv):
+    if argv and argv[0] == "--db":
+        bench_db(int(argv[1]) if len(argv) > 1 else 200)
+    else:
+        bench_rows(int(argv[0]) if argv else 100000)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
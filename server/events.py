@@ -0,0 +1,247 @@
+"""Append-only booking status history (``booking_events``).
+
+Views call ``record()``, which only appends to an in-memory buffer. A
+background thread writes the buffer with one multi-row INSERT when it reaches
+``batch_size`` events or every ``flush_seconds``. Batches that cannot be
+written (database down, process exiting) are appended to a local JSON-lines
+file and replayed on the next successful flush.
+
+Each event remembers which database it was recorded against (see
+``db.branch``), so bookings of branches with their own database get their
+history written there.
+"""
+
+import atexit
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from . import db
+
+EVENTS_CONFIG = {
+    "batch_size": 200,
+    "flush_seconds": 2.0,
+    "fallback_path": os.path.join(os.path.dirname(__file__), "..", "booking_events.pending.jsonl"),
+}
+
+INSERT_SQL = """INSERT INTO booking_events
+    (booking_id, new_status, remarks, actor_user_id, actor_role, created_at)
+    VALUES (%s,%s,%s,%s,%s,%s)"""
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class EventBuffer:
+    def __init__(self, batch_size, flush_seconds, fallback_path):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.fallback_path = fallback_path
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="booking-events", daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def add(self, database, row):
+        with self.lock:
+            self.pending.append((database, row))
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_seconds)
+            self.wakeup.clear()
+            self.flush()
+
+    def _take(self):
+        with self.lock:
+            rows, self.pending = self.pending, []
+        return rows
+
+    def flush(self):
+        """Write everything buffered; spill to the fallback file on failure."""
+        with self.flush_lock:
+            entries = self._take()
+            try:
+                self._replay_fallback()
+            except Exception as e:
+                print("[EVENTS] Error while replaying booking events:", e)
+            for database, rows in _by_database(entries).items():
+                try:
+                    with db.branch(database):
+                        db.execute_many(INSERT_SQL, rows)
+                except Exception as e:
+                    print("[EVENTS] Error while writing booking events:", e)
+                    self._spill([(database, row) for row in rows])
+
+    def close(self):
+        self.flush()
+
+    def _spill(self, entries):
+        if not entries:
+            return
+        with open(self.fallback_path, "a", encoding="utf-8") as f:
+            for database, row in entries:
+                f.write(json.dumps([database, row]) + "\n")
+
+    def _replay_fallback(self):
+        if not os.path.exists(self.fallback_path):
+            return
+        # Claim the file first so two processes never replay the same events
+        claimed = f"{self.fallback_path}.{os.getpid()}"
+        try:
+            os.replace(self.fallback_path, claimed)
+        except FileNotFoundError:
+            return
+        entries = []
+        with open(claimed, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    # Lines written before branches existed are bare rows
+                    database, row = item if len(item) == 2 else (None, item)
+                    entries.append((database, tuple(row)))
+        failed = []
+        error = None
+        for database, rows in _by_database(entries).items():
+            try:
+                with db.branch(database):
+                    db.execute_many(INSERT_SQL, rows)
+            except Exception as e:
+                failed.extend((database, row) for row in rows)
+                error = e
+        self._spill(failed)
+        os.remove(claimed)
+        if error:
+            raise error
+
+
+def _by_database(entries):
+    grouped = {}
+    for database, row in entries:
+        grouped.setdefault(database, []).append(row)
+    return grouped
+
+
+_buffer = EventBuffer(**EVENTS_CONFIG)
+
+
+def record(booking_id, status, session=None, remarks=None):
+    """Queue one status change for ``booking_id`` made by ``session``'s user."""
+    _buffer.start()
+    _buffer.add(db.database_key(), (
+        int(booking_id),
+        status,
+        remarks or None,
+        session.get("user_id") if session else None,
+        session.get("role") if session else None,
+        datetime.now().strftime(TIME_FORMAT),
+    ))
+
+
+def flush():
+    _buffer.flush()
+
+
+def timeline(booking_id):
+    """All status changes of one booking, oldest first."""
+    return db.query_all(
+        """SELECT e.event_id, e.new_status, e.remarks, e.actor_role, e.created_at,
+                  COALESCE(c.full_name, m.full_name, u.email) AS actor_name
+           FROM booking_events e
+           LEFT JOIN users u ON e.actor_user_id = u.user_id
+           LEFT JOIN customers c ON c.user_id = u.user_id
+           LEFT JOIN mechanics m ON m.user_id = u.user_id
+           WHERE e.booking_id=%s
+           ORDER BY e.created_at, e.event_id""",
+        (booking_id,),
+    )
+
+
+# Every booking, hot or archived, with the columns the statistics group by
+REPORT_DAYS = 90    # turnaround reports cover bookings made in this many days
+
+_GROUPS = {
+    "service": ("s.service_name", "JOIN services s ON x.service_id = s.service_id"),
+    "mechanic": ("m.full_name", "JOIN mechanics m ON x.assigned_mechanic_id = m.mechanic_id"),
+}
+
+
+def _bookings_since(since, branch_id):
+    """Live and archived bookings made since ``since`` (optionally in one
+    branch), as a derived table plus its params.
+
+    The reports start from these, on the (branch_id, booking_date) indexes,
+    and read each booking's events by booking_id, instead of windowing every
+    event in the period before dropping other branches'.
+    """
+    if since is None:
+        since = datetime.now() - timedelta(days=REPORT_DAYS)
+    where, params = "booking_date >= %s", (since,)
+    if branch_id is not None:
+        where, params = "branch_id=%s AND booking_date >= %s", (branch_id, since)
+    sql = f"""(SELECT booking_id, service_id, assigned_mechanic_id FROM bookings WHERE {where}
+               UNION ALL
+               SELECT booking_id, service_id, assigned_mechanic_id FROM bookings_archive WHERE {where})"""
+    return sql, params * 2
+
+
+def stage_durations(group_by="service", since=None, branch_id=None):
+    """Average minutes a booking spends in each status, per service or mechanic,
+    over bookings made since ``since`` (default: the last ``REPORT_DAYS``).
+
+    A stage lasts from its event until the booking's next event; the final
+    stage of each booking is open-ended and not counted.
+    """
+    label, join = _GROUPS[group_by]
+    bookings, params = _bookings_since(since, branch_id)
+    sql = f"""
+        SELECT {label} AS name, x.new_status AS status, COUNT(*) AS n,
+               AVG(TIMESTAMPDIFF(SECOND, x.created_at, x.next_at)) / 60 AS avg_minutes,
+               MAX(TIMESTAMPDIFF(SECOND, x.created_at, x.next_at)) / 60 AS max_minutes
+        FROM (
+            SELECT b.service_id, b.assigned_mechanic_id, e.new_status, e.created_at,
+                   LEAD(e.created_at) OVER (PARTITION BY e.booking_id
+                                            ORDER BY e.created_at, e.event_id) AS next_at
+            FROM {bookings} b
+            JOIN booking_events e ON e.booking_id = b.booking_id
+        ) x
+        {join}
+        WHERE x.next_at IS NOT NULL
+        GROUP BY {label}, x.new_status
+        ORDER BY {label}, x.new_status
+    """
+    return db.query_all(sql, params)
+
+
+def turnaround(group_by="service", since=None, branch_id=None):
+    """Average hours from BOOKED to the first COMPLETED, per service or mechanic,
+    over bookings made since ``since`` (default: the last ``REPORT_DAYS``)."""
+    label, join = _GROUPS[group_by]
+    bookings, params = _bookings_since(since, branch_id)
+    sql = f"""
+        SELECT {label} AS name, COUNT(*) AS n,
+               AVG(TIMESTAMPDIFF(SECOND, x.booked_at, x.completed_at)) / 3600 AS avg_hours
+        FROM (
+            SELECT b.service_id, b.assigned_mechanic_id,
+                   MIN(CASE WHEN e.new_status='BOOKED' THEN e.created_at END) AS booked_at,
+                   MIN(CASE WHEN e.new_status='COMPLETED' THEN e.created_at END) AS completed_at
+            FROM {bookings} b
+            JOIN booking_events e ON e.booking_id = b.booking_id
+            GROUP BY b.booking_id, b.service_id, b.assigned_mechanic_id
+        ) x
+        {join}
+        WHERE x.booked_at IS NOT NULL AND x.completed_at IS NOT NULL
+        GROUP BY {label}
+        ORDER BY avg_hours DESC
+    """
+    return db.query_all(sql, params)
@@ -0,0 +1,355 @@
+"""Capacity forecasting for time slots and mechanics (requires NumPy).
+
+Booking history is held in memory as parallel NumPy arrays (one entry per
+non-cancelled booking: slot day, start hour, service, mechanic, slot,
+branch), one history per database (see ``db.branch``). New
+bookings are appended incrementally by booking_id; the whole history is
+reloaded every ``full_reload_seconds`` to pick up cancellations.
+
+Demand is an exponentially weighted average of weekly bookings per
+(weekday, hour), computed with ``np.bincount`` over the arrays. Suggested slot
+capacity is the Poisson-style upper bound ``ceil(rate + z * sqrt(rate))``.
+
+If NumPy is not installed, ``available()`` is False and the admin pages
+simply omit the forecast columns.
+"""
+
+import threading
+import time
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+from . import db
+
+FORECAST_CONFIG = {
+    "history_days": 730,
+    "half_life_weeks": 8,          # weight of a week halves every N weeks back
+    "service_level_z": 1.28,       # ~90% of weeks fit within the suggested capacity
+    "horizon_days": 14,
+    "mechanic_jobs_per_day": 6,
+    "backtest_weeks": 8,
+    "refresh_seconds": 30,         # how often new bookings are pulled in
+    "full_reload_seconds": 3600,   # how often the whole history is reloaded
+}
+
+EPOCH = date(1970, 1, 1)
+HOURS = 24
+CELLS = 7 * HOURS                  # (weekday, hour) buckets per week
+
+_HISTORY_SQL = """
+    SELECT b.booking_id, DATEDIFF(t.slot_date, '1970-01-01') AS day,
+           HOUR(t.start_time) AS hour, b.service_id,
+           COALESCE(b.assigned_mechanic_id, 0) AS mechanic_id, b.slot_id, b.branch_id
+    FROM {table} b
+    JOIN time_slots t ON b.slot_id = t.slot_id
+    WHERE b.current_status <> 'CANCELLED'
+      AND t.slot_date >= CURDATE() - INTERVAL %s DAY
+      AND b.booking_id > %s
+"""
+
+COLUMNS = ("booking_id", "day", "hour", "service_id", "mechanic_id", "slot_id", "branch_id")
+
+
+def available():
+    return np is not None
+
+
+def day_number(d):
+    return (d - EPOCH).days
+
+
+def weekday_of(days):
+    """Monday=0 weekday of day numbers (1970-01-01 was a Thursday)."""
+    return (days + 3) % 7
+
+
+def week_of(days):
+    return (days + 3) // 7
+
+
+class History:
+    """Booking history as NumPy arrays, refreshed incrementally."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arrays = None
+        self.last_id = 0
+        self.loaded_at = 0.0
+        self.refreshed_at = 0.0
+        self.version = 0
+
+    def _fetch(self, table, after_id):
+        rows = db.query_all(
+            _HISTORY_SQL.format(table=table),
+            (FORECAST_CONFIG["history_days"], after_id),
+        )
+        return {
+            col: np.fromiter((r[col] for r in rows), dtype=np.int64, count=len(rows))
+            for col in COLUMNS
+        }
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            if self.arrays is None or force or now - self.loaded_at > FORECAST_CONFIG["full_reload_seconds"]:
+                hot = self._fetch("bookings", 0)
+                cold = self._fetch("bookings_archive", 0)
+                self.arrays = {c: np.concatenate([hot[c], cold[c]]) for c in COLUMNS}
+                self.loaded_at = self.refreshed_at = now
+                self.version += 1
+            elif now - self.refreshed_at > FORECAST_CONFIG["refresh_seconds"]:
+                new = self._fetch("bookings", self.last_id)
+                if len(new["booking_id"]):
+                    self.arrays = {c: np.concatenate([self.arrays[c], new[c]]) for c in COLUMNS}
+                    self.version += 1
+                self.refreshed_at = now
+            ids = self.arrays["booking_id"]
+            self.last_id = int(ids.max()) if len(ids) else 0
+            return self.arrays
+
+
+_histories = {}            # db.database_key() -> History
+_histories_lock = threading.Lock()
+_cache = {}                # db.database_key() -> (history version, {key: result})
+
+
+def _history():
+    key = db.database_key()
+    with _histories_lock:
+        if key not in _histories:
+            _histories[key] = History()
+        return _histories[key]
+
+
+def _for_branch(arrays, branch_id):
+    if branch_id is None:
+        return arrays
+    mask = arrays["branch_id"] == branch_id
+    return {c: arrays[c][mask] for c in COLUMNS}
+
+
+def _cached(key, compute, branch_id=None):
+    """Memoise results per history version so repeated page loads are free.
+    Only results for the current version are kept."""
+    history = _history()
+    arrays = history.refresh()
+    database = db.database_key()
+    version, results = _cache.get(database, (None, None))
+    if version != history.version:
+        results = {}
+        _cache[database] = (history.version, results)
+    key = (branch_id,) + key
+    if key not in results:
+        results[key] = compute(_for_branch(arrays, branch_id))
+    return results[key]
+
+
+def weekly_rates(days, cells, as_of_day, n_groups=1, groups=None):
+    """Expected bookings per week for each (group, weekday, hour) cell.
+
+    Only complete weeks before the week of ``as_of_day`` count, so every
+    cell sees the same number of weeks. Each booking is weighted by
+    ``0.5 ** (weeks ago / half life)`` and the sums are divided by the
+    total weight of the weeks in the window, giving a weighted weekly mean.
+    """
+    half_life = FORECAST_CONFIG["half_life_weeks"]
+    as_of_week = week_of(as_of_day)
+    first_week = week_of(as_of_day - FORECAST_CONFIG["history_days"]) + 1   # first full week
+
+    booking_weeks = week_of(days)
+    mask = (booking_weeks < as_of_week) & (booking_weeks >= first_week)
+    weeks_ago = as_of_week - booking_weeks[mask]
+    weights = 0.5 ** (weeks_ago / half_life)
+    index = cells[mask]
+    if groups is not None:
+        index = groups[mask] * CELLS + index
+    totals = np.bincount(index, weights=weights, minlength=n_groups * CELLS)
+
+    window = as_of_week - np.arange(first_week, as_of_week)
+    norm = (0.5 ** (window / half_life)).sum()
+    return (totals / norm if norm else totals).reshape(n_groups, 7, HOURS)
+
+
+def suggested_capacity(rates):
+    z = FORECAST_CONFIG["service_level_z"]
+    return np.maximum(1, np.ceil(rates + z * np.sqrt(rates))).astype(np.int64)
+
+
+def _cells(arrays):
+    return weekday_of(arrays["day"]) * HOURS + arrays["hour"]
+
+
+def demand(as_of_day=None, branch_id=None):
+    """Total weekly demand per (weekday, hour) as a 7x24 array."""
+    as_of_day = day_number(date.today()) if as_of_day is None else as_of_day
+    return _cached(("demand", as_of_day),
+                   lambda a: weekly_rates(a["day"], _cells(a), as_of_day)[0], branch_id)
+
+
+def demand_by_service(as_of_day=None, branch_id=None):
+    """(service_ids, array[n_services, 7, 24]) of weekly demand."""
+    as_of_day = day_number(date.today()) if as_of_day is None else as_of_day
+
+    def compute(a):
+        ids, groups = np.unique(a["service_id"], return_inverse=True)
+        return ids, weekly_rates(a["day"], _cells(a), as_of_day, len(ids), groups)
+
+    return _cached(("service", as_of_day), compute, branch_id)
+
+
+def booked_counts(slot_ids):
+    """{slot_id: non-cancelled bookings} read live, not from the history, so
+    the page shows bookings and cancellations made since the last refresh."""
+    if not slot_ids:
+        return {}
+    marks = ",".join(["%s"] * len(slot_ids))
+    rows = db.query_all(
+        f"""SELECT slot_id, COUNT(*) AS n FROM (
+                SELECT slot_id FROM bookings
+                WHERE slot_id IN ({marks}) AND current_status <> 'CANCELLED'
+                UNION ALL
+                SELECT slot_id FROM bookings_archive
+                WHERE slot_id IN ({marks}) AND current_status <> 'CANCELLED'
+            ) b
+            GROUP BY slot_id""",
+        tuple(slot_ids) * 2,
+    )
+    return {r["slot_id"]: r["n"] for r in rows}
+
+
+def slot_suggestions(slots, branch_id=None):
+    """Booked count, utilisation, forecast and suggested capacity per slot.
+
+    ``slots`` are time_slots rows; returns {slot_id: dict}. Forecasts are
+    only given for slots from today onwards.
+    """
+    if not slots:
+        return {}
+    today = day_number(date.today())
+    slot_ids = np.array([s["slot_id"] for s in slots], dtype=np.int64)
+    days = np.array([day_number(s["slot_date"]) for s in slots], dtype=np.int64)
+    hours = np.array([_hour(s["start_time"]) for s in slots], dtype=np.int64)
+    capacity = np.array([s["max_bookings"] for s in slots], dtype=np.float64)
+
+    counts = booked_counts(slot_ids.tolist())
+    booked = np.array([counts.get(i, 0) for i in slot_ids.tolist()], dtype=np.int64)
+
+    # Several slots in the same weekday/hour share that cell's demand
+    cells = weekday_of(days) * HOURS + hours
+    rate = demand(branch_id=branch_id).reshape(-1)[cells]
+    same_cell = np.unique(days * HOURS + hours, return_inverse=True, return_counts=True)
+    rate = rate / same_cell[2][same_cell[1]]
+    suggested = suggested_capacity(rate)
+    utilisation = np.divide(booked, capacity, out=np.zeros_like(capacity), where=capacity > 0)
+
+    result = {}
+    for i, slot_id in enumerate(slot_ids.tolist()):
+        upcoming = days[i] >= today
+        result[slot_id] = {
+            "booked": int(booked[i]),
+            "utilisation": float(utilisation[i]),
+            "forecast": float(rate[i]) if upcoming else None,
+            "suggested": int(suggested[i]) if upcoming else None,
+        }
+    return result
+
+
+def mechanic_load(horizon_days=None, branch_id=None):
+    """Forecast jobs per mechanic per day over the horizon.
+
+    Returns (mechanic_ids, dates, jobs[n_mechanics, n_days], utilisation)
+    where utilisation is jobs / ``mechanic_jobs_per_day``.
+    """
+    horizon_days = horizon_days or FORECAST_CONFIG["horizon_days"]
+    today = day_number(date.today())
+
+    def compute(a):
+        assigned = a["mechanic_id"] > 0
+        ids, groups = np.unique(a["mechanic_id"][assigned], return_inverse=True)
+        sub = {c: a[c][assigned] for c in COLUMNS}
+        rates = weekly_rates(sub["day"], _cells(sub), today, len(ids), groups)
+        per_weekday = rates.sum(axis=2)                       # [mechanics, 7]
+        future = today + np.arange(horizon_days)
+        jobs = per_weekday[:, weekday_of(future)]             # [mechanics, horizon]
+        dates = [EPOCH + timedelta(days=int(d)) for d in future]
+        return ids, dates, jobs, jobs / FORECAST_CONFIG["mechanic_jobs_per_day"]
+
+    return _cached(("mechanics", today, horizon_days), compute, branch_id)
+
+
+def backtest(weeks=None, branch_id=None):
+    """Replay the last ``weeks`` weeks: forecast each from the data before it.
+
+    Returns mean absolute error per (weekday, hour) cell, bias, and the share
+    of cells whose actual bookings fit within the suggested capacity.
+    """
+    weeks = weeks or FORECAST_CONFIG["backtest_weeks"]
+    today = day_number(date.today())
+
+    def compute(a):
+        cells = _cells(a)
+        week_start = today - weekday_of(today) - 7 * weeks   # a Monday
+        errors, biases, covered, n = 0.0, 0.0, 0, 0
+        for k in range(weeks):
+            start = week_start + 7 * k
+            predicted = weekly_rates(a["day"], cells, start)[0].reshape(-1)
+            in_week = (a["day"] >= start) & (a["day"] < start + 7)
+            actual = np.bincount(cells[in_week], minlength=CELLS)
+            # Only score cells that ever had demand; the rest are closed hours
+            active = (predicted > 0) | (actual > 0)
+            diff = actual[active] - predicted[active]
+            errors += np.abs(diff).sum()
+            biases += diff.sum()
+            covered += int((actual[active] <= suggested_capacity(predicted[active])).sum())
+            n += int(active.sum())
+        if not n:
+            return {"weeks": weeks, "cells": 0, "mae": 0.0, "bias": 0.0, "coverage": 0.0}
+        return {
+            "weeks": weeks,
+            "cells": n,
+            "mae": float(errors / n),
+            "bias": float(biases / n),
+            "coverage": covered / n,
+        }
+
+    return _cached(("backtest", today, weeks), compute, branch_id)
+
+
+def _hour(start_time):
+    """Hour of a TIME column (MySQL returns it as a timedelta)."""
+    if isinstance(start_time, timedelta):
+        return int(start_time.total_seconds() // 3600) % 24
+    if hasattr(start_time, "hour"):
+        return start_time.hour
+    return int(str(start_time).split(":")[0])
+
+
+def safe(func, *args, **kwargs):
+    """Call a forecast function for a page; None if NumPy is missing or it fails."""
+    if not available():
+        return None
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        print("[FORECAST] Error:", e)
+        return None
+
+
+if __name__ == "__main__":
+    if not available():
+        raise SystemExit("NumPy is required: pip install numpy")
+    started = time.perf_counter()
+    history = _history()
+    history.refresh(force=True)
+    loaded = time.perf_counter()
+    result = backtest()
+    mechanic_load()
+    done = time.perf_counter()
+    print(f"[FORECAST] {len(history.arrays['booking_id'])} bookings loaded in "
+          f"{loaded - started:.3f}s, forecasts in {done - loaded:.3f}s")
+    print(f"[FORECAST] Backtest over {result['weeks']} weeks: MAE {result['mae']:.2f}, "
+          f"bias {result['bias']:+.2f}, coverage {result['coverage']:.0%}")
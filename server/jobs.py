@@ -0,0 +1,339 @@
+"""Durable background job queue backed by a local SQLite file.
+
+Views call ``enqueue()`` and return immediately; a separate worker process
+runs the registered handlers:
+
+    python -m server.jobs          # 4 worker threads
+    python -m server.jobs 8        # 8 worker threads
+
+Jobs are claimed in priority order (lower number first), retried with
+exponential backoff and moved to the DEAD status once ``max_attempts`` is
+exhausted. A job whose worker died is picked up again when its lease expires
+(or dead-lettered, if that was its last attempt). A worker that outlived its
+lease can no longer complete or fail the job: another worker owns it by then.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+
+JOBS_CONFIG = {
+    "db_path": os.path.join(os.path.dirname(__file__), "..", "jobs.sqlite3"),
+    "max_attempts": 5,
+    "backoff_base_seconds": 2,     # retry n waits base * 2**(n-1) seconds
+    "backoff_max_seconds": 600,
+    "lease_seconds": 300,          # RUNNING jobs older than this are re-claimed
+    "poll_seconds": 0.5,           # worker sleep when the queue is empty
+}
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 100
+PRIORITY_LOW = 1000
+
+HANDLERS = {}
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 100,
+    idempotency_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'QUEUED',   -- QUEUED, RUNNING, DONE, DEAD
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    locked_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, priority, run_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (status, finished_at);
+"""
+
+
+def get_connection():
+    global _schema_ready
+    conn = sqlite3.connect(JOBS_CONFIG["db_path"], timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout=10000")
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                _schema_ready = True
+    return conn
+
+
+def handler(name):
+    """Decorator registering ``func(payload)`` as the handler for ``name``."""
+    def register(func):
+        HANDLERS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, priority=PRIORITY_NORMAL, idempotency_key=None,
+            delay=0, max_attempts=None):
+    """Queue a job and return its id.
+
+    If ``idempotency_key`` was already used, nothing is queued and the id of
+    the existing job is returned.
+    """
+    now = time.time()
+    conn = get_connection()
+    try:
+        cur = conn.execute(
+            """INSERT OR IGNORE INTO jobs
+                (name, payload, priority, idempotency_key, max_attempts, run_at, created_at)
+                VALUES (?,?,?,?,?,?,?)""",
+            (name, json.dumps(payload or {}), priority, idempotency_key,
+             max_attempts or JOBS_CONFIG["max_attempts"], now + delay, now),
+        )
+        if cur.rowcount:
+            return cur.lastrowid
+        row = conn.execute(
+            "SELECT job_id FROM jobs WHERE idempotency_key=?", (idempotency_key,)
+        ).fetchone()
+        return row["job_id"] if row else None
+    finally:
+        conn.close()
+
+
+def claim():
+    """Atomically take the next runnable job, or return None.
+
+    The returned job carries the ``locked_until`` of its lease, which
+    ``complete()`` and ``fail()`` check so a worker that lost the lease
+    cannot overwrite the result of the worker that took it over.
+    """
+    now = time.time()
+    conn = get_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        # Expired leases on their last attempt are dead, not retried
+        conn.execute(
+            """UPDATE jobs SET status='DEAD', finished_at=?, locked_until=NULL,
+                   last_error='Lease expired on attempt ' || attempts
+               WHERE status='RUNNING' AND locked_until<? AND attempts>=max_attempts""",
+            (now, now),
+        )
+        row = conn.execute(
+            """SELECT * FROM jobs
+               WHERE (status='QUEUED' AND run_at<=?)
+                  OR (status='RUNNING' AND locked_until<?)
+               ORDER BY priority, run_at
+               LIMIT 1""",
+            (now, now),
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        locked_until = now + JOBS_CONFIG["lease_seconds"]
+        conn.execute(
+            """UPDATE jobs SET status='RUNNING', attempts=attempts+1,
+                   started_at=?, locked_until=?
+               WHERE job_id=?""",
+            (now, locked_until, row["job_id"]),
+        )
+        conn.execute("COMMIT")
+        job = dict(row)
+        job["attempts"] += 1
+        job["status"] = "RUNNING"
+        job["locked_until"] = locked_until
+        return job
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _kept_lease(cur, job):
+    """True if the UPDATE in ``cur`` matched, i.e. the job was still ours."""
+    if cur.rowcount:
+        return True
+    print(f"[JOBS] Job {job['job_id']} ({job['name']}) lost its lease; result discarded")
+    return False
+
+
+def complete(job):
+    """Mark a claimed job done; False if its lease was lost meanwhile."""
+    conn = get_connection()
+    try:
+        cur = conn.execute(
+            """UPDATE jobs SET status='DONE', finished_at=?, locked_until=NULL
+               WHERE job_id=? AND status='RUNNING' AND locked_until=?""",
+            (time.time(), job["job_id"], job["locked_until"]),
+        )
+        return _kept_lease(cur, job)
+    finally:
+        conn.close()
+
+
+def fail(job, error):
+    """Schedule a retry with backoff, or dead-letter the job.
+
+    Returns False if the job's lease was lost meanwhile.
+    """
+    now = time.time()
+    conn = get_connection()
+    try:
+        if job["attempts"] >= job["max_attempts"]:
+            cur = conn.execute(
+                """UPDATE jobs SET status='DEAD', finished_at=?, locked_until=NULL,
+                       last_error=? WHERE job_id=? AND status='RUNNING' AND locked_until=?""",
+                (now, error, job["job_id"], job["locked_until"]),
+            )
+        else:
+            backoff = min(
+                JOBS_CONFIG["backoff_base_seconds"] * 2 ** (job["attempts"] - 1),
+                JOBS_CONFIG["backoff_max_seconds"],
+            )
+            cur = conn.execute(
+                """UPDATE jobs SET status='QUEUED', run_at=?, locked_until=NULL,
+                       last_error=? WHERE job_id=? AND status='RUNNING' AND locked_until=?""",
+                (now + backoff, error, job["job_id"], job["locked_until"]),
+            )
+        return _kept_lease(cur, job)
+    finally:
+        conn.close()
+
+
+def retry_dead(job_id):
+    """Put a dead-lettered job back on the queue with a fresh attempt count."""
+    conn = get_connection()
+    try:
+        conn.execute(
+            """UPDATE jobs SET status='QUEUED', attempts=0, run_at=?, last_error=NULL
+               WHERE job_id=? AND status='DEAD'""",
+            (time.time(), job_id),
+        )
+    finally:
+        conn.close()
+
+
+def run_job(job):
+    func = HANDLERS.get(job["name"])
+    if func is None:
+        fail(job, f"No handler registered for {job['name']!r}")
+        return False
+    try:
+        func(json.loads(job["payload"]))
+    except Exception:
+        print(f"[JOBS] Job {job['job_id']} ({job['name']}) failed, attempt {job['attempts']}")
+        fail(job, traceback.format_exc(limit=5))
+        return False
+    return complete(job)
+
+
+def stats(window_seconds=3600):
+    """Queue depth per status plus latency figures for recently finished jobs."""
+    now = time.time()
+    conn = get_connection()
+    try:
+        depth = {
+            r["status"]: r["n"]
+            for r in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        }
+        oldest = conn.execute(
+            "SELECT MIN(run_at) AS t FROM jobs WHERE status='QUEUED' AND run_at<=?", (now,)
+        ).fetchone()["t"]
+        latency = conn.execute(
+            """SELECT COUNT(*) AS n,
+                      AVG(started_at - created_at) AS avg_wait,
+                      MAX(started_at - created_at) AS max_wait,
+                      AVG(finished_at - started_at) AS avg_run
+               FROM jobs WHERE status='DONE' AND finished_at>=?""",
+            (now - window_seconds,),
+        ).fetchone()
+        return {
+            "queued": depth.get("QUEUED", 0),
+            "running": depth.get("RUNNING", 0),
+            "done": depth.get("DONE", 0),
+            "dead": depth.get("DEAD", 0),
+            "oldest_ready_age": (now - oldest) if oldest else 0.0,
+            "finished_recently": latency["n"],
+            "avg_wait": latency["avg_wait"] or 0.0,
+            "max_wait": latency["max_wait"] or 0.0,
+            "avg_run": latency["avg_run"] or 0.0,
+        }
+    finally:
+        conn.close()
+
+
+def dead_jobs(limit=50):
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE status='DEAD' ORDER BY finished_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def purge_done(older_than_seconds=7 * 86400):
+    conn = get_connection()
+    try:
+        conn.execute(
+            "DELETE FROM jobs WHERE status='DONE' AND finished_at<?",
+            (time.time() - older_than_seconds,),
+        )
+    finally:
+        conn.close()
+
+
+def worker_loop(stop_event):
+    while not stop_event.is_set():
+        try:
+            job = claim()
+        except sqlite3.Error as e:
+            print("[JOBS] Error while claiming job:", e)
+            job = None
+        if job is None:
+            stop_event.wait(JOBS_CONFIG["poll_seconds"])
+            continue
+        run_job(job)
+
+
+def run_workers(count=4):
+    """Run ``count`` worker threads until interrupted."""
+    from . import tasks  # noqa: F401  (registers the handlers)
+
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=worker_loop, args=(stop_event,), name=f"job-worker-{i}", daemon=True)
+        for i in range(count)
+    ]
+    for t in threads:
+        t.start()
+    print(f"[JOBS] {count} workers running on {os.path.abspath(JOBS_CONFIG['db_path'])}")
+    try:
+        while True:
+            time.sleep(60)
+            purge_done()
+    except KeyboardInterrupt:
+        print("[JOBS] Stopping workers ...")
+        stop_event.set()
+        for t in threads:
+            t.join()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    run_workers(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""On-demand profiling of single requests.
+
+A request is profiled when it carries an ``X-Profile: 1`` header and comes
+from an admin session (or also sends ``X-Profile-Token`` matching
+``PROFILE_CONFIG["token"]``, to profile pages of other roles), or when it is
+picked by the per-route sampling rate in ``SAMPLE_RATES``. Requests that are
+not selected go straight to the view.
+
+A profiled request records:
+
+* a cProfile run, saved as ``<id>.pstats`` (open with ``python -m pstats``
+  or snakeviz),
+* stack samples from a background thread, saved as ``<id>.folded``
+  (collapsed-stack format for flamegraph.pl / speedscope),
+* the SQL statements run and their durations, saved in ``<id>.json``.
+
+Only the newest ``max_profiles`` profiles are kept on disk. One request is
+profiled at a time (cProfile allows a single active profiler per process,
+and it also records calls made by other threads); a request selected while
+another is being profiled runs unprofiled.
+"""
+
+import cProfile
+import glob
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from . import db
+
+PROFILE_CONFIG = {
+    "dir": os.path.join(os.path.dirname(__file__), "..", "profiles"),
+    "max_profiles": 50,
+    "token": None,                # set a secret to allow header triggering without an admin session
+    "sample_interval": 0.002,     # seconds between stack samples
+}
+
+# path -> fraction of requests to profile automatically, e.g. {"/admin/payments": 0.01}
+SAMPLE_RATES = {}
+
+KINDS = {
+    "pstats": "application/octet-stream",
+    "folded": "text/plain; charset=utf-8",
+    "json": "application/json",
+}
+
+_PROFILE_ID = re.compile(r"^[0-9]+-[0-9]+-[0-9]+$")
+_counter = 0
+_counter_lock = threading.Lock()
+_active = threading.Lock()
+
+
+def should_profile(environ, path, session):
+    if environ.get("HTTP_X_PROFILE") == "1":
+        token = PROFILE_CONFIG["token"]
+        if session and session.get("role") == "ADMIN":
+            return True
+        if token and environ.get("HTTP_X_PROFILE_TOKEN") == token:
+            return True
+    rate = SAMPLE_RATES.get(path)
+    return bool(rate) and random.random() < rate
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(parts))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def _new_id():
+    global _counter
+    with _counter_lock:
+        _counter += 1
+        return f"{int(time.time() * 1000)}-{os.getpid()}-{_counter}"
+
+
+def profile_request(view, environ, start_response, *args):
+    """Run ``view(environ, start_response, *args)`` under the profilers, or
+    plainly if another request is being profiled."""
+    if not _active.acquire(blocking=False):
+        return view(environ, start_response, *args)
+    try:
+        return _profile(view, environ, start_response, *args)
+    finally:
+        _active.release()
+
+
+def _profile(view, environ, start_response, *args):
+    captured = {}
+
+    def capture_start_response(status, headers, exc_info=None):
+        captured["status"] = status
+        return start_response(status, headers, exc_info)
+
+    sampler = StackSampler(threading.get_ident(), PROFILE_CONFIG["sample_interval"])
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    enabled = False
+    try:
+        db.start_trace()
+        sampler.start()
+        profiler.enable()
+        enabled = True
+        body = list(view(environ, capture_start_response, *args))
+    finally:
+        if enabled:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+        if sampler.is_alive():
+            sampler.stop()
+        sql = db.stop_trace()
+        if enabled:
+            try:
+                save(profiler, sampler.stacks, sql, {
+                    "path": environ.get("PATH_INFO", ""),
+                    "query": environ.get("QUERY_STRING", ""),
+                    "method": environ.get("REQUEST_METHOD", ""),
+                    "status": captured.get("status", "500 Internal Server Error"),
+                    "duration_ms": round(elapsed * 1000, 2),
+                })
+            except OSError as e:
+                print("[PROFILE] Error while saving profile:", e)
+    return body
+
+
+def save(profiler, stacks, sql, meta):
+    directory = PROFILE_CONFIG["dir"]
+    os.makedirs(directory, exist_ok=True)
+    profile_id = _new_id()
+    base = os.path.join(directory, profile_id)
+
+    profiler.dump_stats(base + ".pstats")
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    meta = dict(
+        meta,
+        id=profile_id,
+        created=time.strftime("%Y-%m-%d %H:%M:%S"),
+        sql_count=len(sql),
+        sql_ms=round(sum(d for _, d in sql) * 1000, 2),
+        sql=[{"sql": text, "ms": round(d * 1000, 3)} for text, d in sql],
+    )
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1)
+
+    _trim(directory)
+    return profile_id
+
+
+def _trim(directory):
+    metas = sorted(glob.glob(os.path.join(directory, "*.json")), key=os.path.getmtime)
+    for old in metas[:-PROFILE_CONFIG["max_profiles"]]:
+        base = old[:-len(".json")]
+        for kind in KINDS:
+            try:
+                os.remove(f"{base}.{kind}")
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    """Metadata of stored profiles, newest first (without the SQL list)."""
+    profiles = []
+    paths = glob.glob(os.path.join(PROFILE_CONFIG["dir"], "*.json"))
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        try:
+            with open(path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta.pop("sql", None)
+        profiles.append(meta)
+    return profiles
+
+
+def profile_file(profile_id, kind):
+    """Path of one stored file, or None if the id/kind is invalid or missing."""
+    if kind not in KINDS or not _PROFILE_ID.match(profile_id or ""):
+        return None
+    path = os.path.join(PROFILE_CONFIG["dir"], f"{profile_id}.{kind}")
+    return path if os.path.isfile(path) else None
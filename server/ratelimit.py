@@ -0,0 +1,260 @@
+"""Admission control for the WSGI app.
+
+Two mechanisms, both checked in ``app()`` before a view runs:
+
+* Token buckets keyed per client IP, per account and per route, applied to
+  POSTs on login / registration / booking. Exceeding one returns 429 with
+  Retry-After.
+* A concurrency cap per route class. Each class has a fixed number of
+  in-flight slots and a short wait queue; when that queue is full the
+  request is shed immediately with 503 + Retry-After instead of holding a
+  DB connection. Logged-in workflows (mechanic task updates, admin booking
+  updates) have their own class and are never token-bucketed, so a login or
+  booking flood cannot starve them. The caps need a multi-threaded server
+  (``python -m server.app`` runs requests on a pool of worker threads).
+
+Buckets live in memory by default (one table per process, LRU-bounded).
+Set ``RATE_LIMIT_CONFIG["backend"] = "sqlite"`` to share them between
+worker processes on the same host.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from . import auth
+
+RATE_LIMIT_CONFIG = {
+    "enabled": True,
+    "backend": "memory",           # "memory" or "sqlite"
+    "sqlite_path": os.path.join(os.path.dirname(__file__), "..", "ratelimit.sqlite3"),
+    "max_buckets": 100000,         # memory backend: LRU bound on the bucket table
+    "trust_forwarded_for": False,  # use X-Forwarded-For when behind a proxy
+}
+
+# path -> list of (scope, capacity, refill per second); POST requests only.
+# scope is "ip", "account" (email for login, user for booking) or "route".
+RATE_RULES = {
+    "/login": [
+        ("ip", 20, 20 / 60),
+        ("account", 5, 5 / 300),
+        ("route", 200, 50),
+    ],
+    "/register": [
+        ("ip", 5, 5 / 600),
+        ("route", 50, 5),
+    ],
+    "/customer/book": [
+        ("ip", 20, 20 / 60),
+        ("account", 10, 10 / 60),
+        ("route", 100, 20),
+    ],
+}
+
+# route class -> (max in flight, max waiting, max wait seconds)
+CONCURRENCY_CLASSES = {
+    "workflow": (32, 64, 2.0),
+    "auth": (8, 8, 0.2),
+    "booking": (16, 16, 0.5),
+    "default": (64, 64, 1.0),
+}
+
+ROUTE_CLASSES = {
+    "/mechanic/tasks": "workflow",
+    "/admin/bookings": "workflow",
+    "/login": "auth",
+    "/register": "auth",
+    "/customer/book": "booking",
+}
+
+
+class BucketTable:
+    """In-memory token buckets with O(1) LRU eviction."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()   # key -> [tokens, last refill time]
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Take one token; return (allowed, seconds until a token is available)."""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = [capacity, now]
+                self.buckets[key] = bucket
+                if len(self.buckets) > self.max_entries:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0
+            return False, (1 - bucket[0]) / rate
+
+
+class SQLiteBucketTable:
+    """Token buckets in a SQLite file shared by all processes on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS buckets (
+                       bucket_key TEXT PRIMARY KEY,
+                       tokens REAL NOT NULL,
+                       updated REAL NOT NULL)"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_updated ON buckets (updated)")
+        finally:
+            conn.close()
+        self.last_sweep = time.time()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE bucket_key=?", (key,)
+            ).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (bucket_key, tokens, updated) VALUES (?,?,?)",
+                (key, tokens, now),
+            )
+            if now - self.last_sweep > 60:
+                # A bucket idle this long has refilled completely anyway
+                conn.execute("DELETE FROM buckets WHERE updated<?", (now - 3600,))
+                self.last_sweep = now
+            conn.execute("COMMIT")
+            return allowed, 0 if allowed else (1 - tokens) / rate
+        except sqlite3.Error as e:
+            # Fail open: the limiter must never take the site down
+            print("[RATELIMIT] Shared backend error:", e)
+            return True, 0
+        finally:
+            conn.close()
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight requests; waits briefly, then sheds."""
+
+    def __init__(self, limit, max_waiting, max_wait):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.max_wait
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.cond.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+_limiters = {name: ConcurrencyLimiter(*cfg) for name, cfg in CONCURRENCY_CLASSES.items()}
+
+
+def get_buckets():
+    global _buckets
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                if RATE_LIMIT_CONFIG["backend"] == "sqlite":
+                    _buckets = SQLiteBucketTable(RATE_LIMIT_CONFIG["sqlite_path"])
+                else:
+                    _buckets = BucketTable(RATE_LIMIT_CONFIG["max_buckets"])
+    return _buckets
+
+
+def client_ip(environ):
+    if RATE_LIMIT_CONFIG["trust_forwarded_for"]:
+        forwarded = environ.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return environ.get("REMOTE_ADDR", "")
+
+
+def _account_key(environ, path, session):
+    if session:
+        return f"user:{session['user_id']}"
+    if path == "/login":
+        email = auth.parse_post(environ).get("email", "").strip().lower()
+        return f"email:{email}" if email else None
+    return None
+
+
+def check_rate(environ, path, session):
+    """Return None if the request may proceed, else seconds to Retry-After."""
+    if not RATE_LIMIT_CONFIG["enabled"] or environ["REQUEST_METHOD"] != "POST":
+        return None
+    rules = RATE_RULES.get(path)
+    if not rules:
+        return None
+
+    buckets = get_buckets()
+    for scope, capacity, rate in rules:
+        if scope == "ip":
+            key = f"{path}|ip:{client_ip(environ)}"
+        elif scope == "account":
+            account = _account_key(environ, path, session)
+            if account is None:
+                continue
+            key = f"{path}|{account}"
+        else:
+            key = f"{path}|route"
+        allowed, retry_after = buckets.take(key, capacity, rate)
+        if not allowed:
+            return max(1, math.ceil(retry_after))
+    return None
+
+
+def acquire(path):
+    """Take a concurrency slot for the route's class.
+
+    Returns the limiter to release afterwards, None when limiting is off,
+    or False when the request should be shed.
+    """
+    if not RATE_LIMIT_CONFIG["enabled"]:
+        return None
+    limiter = _limiters[ROUTE_CLASSES.get(path, "default")]
+    return limiter if limiter.acquire() else False
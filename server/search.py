@@ -0,0 +1,287 @@
+"""Trigram search over vehicles and customers for the admin front desk.
+
+Each vehicle number and customer name / phone is split into 3-character
+grams stored in ``search_grams`` (primary key on the gram, so a lookup is an
+index range scan per gram rather than a ``LIKE '%...%'`` table scan). The
+index is updated by the views whenever those rows are written; rebuild it
+from scratch with:
+
+    python -m server.search
+
+Booking IDs are matched exactly against the bookings primary key of every
+branch database.
+
+At most ``max_postings_per_gram`` index rows are read per gram. Grams with
+more postings than that (e.g. the state prefix of every plate) are too
+common to narrow the search and are ignored when the query has rarer grams,
+so a lookup stays a few short index range scans however large the index
+grows. ``python -m server.searchbench`` measures this on synthetic data.
+"""
+
+import math
+import re
+from collections import Counter
+
+from . import branches, db
+
+SEARCH_CONFIG = {
+    "max_results": 20,
+    "max_candidates": 200,    # entities fetched from the index before ranking
+    "max_postings_per_gram": 1000,
+    "min_match_ratio": 0.6,   # share of the query's grams a candidate must contain
+    "rebuild_batch_size": 2000,
+}
+
+_NON_WORD = re.compile(r"[^\w\s]+", re.UNICODE)
+
+
+def normalize(text):
+    """Lowercase and strip punctuation; returns the list of tokens."""
+    return _NON_WORD.sub("", (text or "").lower()).split()
+
+
+def compact(text):
+    """Plate numbers and phones: drop every separator ("MH-12 AB" -> "mh12ab")."""
+    return "".join(normalize(text))
+
+
+def index_grams(tokens):
+    """Grams stored for a document: every token padded with '$' on both ends."""
+    grams = set()
+    for token in tokens:
+        padded = f"${token}$"
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def query_grams(tokens):
+    """Grams looked up for a query: the unpadded grams of each token, so they
+    match anywhere inside a word. Tokens shorter than three characters give
+    none; they still count through ``compact(query)``, e.g. "ab 12" -> "ab12".
+    """
+    grams = set()
+    for token in tokens:
+        for i in range(len(token) - 2):
+            grams.add(token[i:i + 3])
+    return grams
+
+
+def _vehicle_tokens(vehicle_number):
+    return [compact(vehicle_number)]
+
+
+def _customer_tokens(full_name, phone):
+    words = normalize(full_name)
+    digits = re.sub(r"\D", "", phone or "")
+    # The joined name lets "ravi kum" match "Ravi Kumar" across the word gap
+    joined = ["".join(words)] if len(words) > 1 else []
+    return words + joined + ([digits] if digits else [])
+
+
+def _replace_grams(cur, entity_type, entity_id, grams):
+    cur.execute(
+        "DELETE FROM search_grams WHERE entity_type=%s AND entity_id=%s",
+        (entity_type, entity_id),
+    )
+    if grams:
+        cur.executemany(
+            "INSERT IGNORE INTO search_grams (gram, entity_type, entity_id) VALUES (%s,%s,%s)",
+            [(g, entity_type, entity_id) for g in grams],
+        )
+
+
+def index_vehicle(vehicle_id, vehicle_number):
+    try:
+        with db.transaction() as cur:
+            _replace_grams(cur, "VEHICLE", vehicle_id, index_grams(_vehicle_tokens(vehicle_number)))
+    except Exception as e:
+        print("[SEARCH] Error while indexing vehicle:", e)
+
+
+def index_customer(customer_id, full_name, phone):
+    try:
+        with db.transaction() as cur:
+            _replace_grams(cur, "CUSTOMER", customer_id, index_grams(_customer_tokens(full_name, phone)))
+    except Exception as e:
+        print("[SEARCH] Error while indexing customer:", e)
+
+
+def remove(entity_type, entity_id):
+    try:
+        db.execute(
+            "DELETE FROM search_grams WHERE entity_type=%s AND entity_id=%s",
+            (entity_type, entity_id),
+        )
+    except Exception as e:
+        print("[SEARCH] Error while removing from index:", e)
+
+
+def _candidates(grams, entity_type, table="search_grams"):
+    """Best-matching ``entity_type`` ids for ``grams``.
+
+    Returns (hits, n_grams): a dict of entity_id -> matched grams, best
+    first, and the number of grams they were counted over.
+    """
+    if not grams:
+        return {}, 0
+    cap = SEARCH_CONFIG["max_postings_per_gram"]
+    grams = sorted(grams)
+    part = f"(SELECT gram, entity_id FROM {table} WHERE gram=%s AND entity_type=%s LIMIT %s)"
+    params = []
+    for g in grams:
+        params += [g, entity_type, cap + 1]
+    rows = db.query_all(" UNION ALL ".join([part] * len(grams)), tuple(params))
+
+    per_gram = Counter(r["gram"] for r in rows)
+    selective = {g for g in grams if per_gram[g] <= cap}
+    counted = selective or set(grams)
+    hits = Counter(r["entity_id"] for r in rows if r["gram"] in counted)
+
+    needed = max(1, math.ceil(len(counted) * SEARCH_CONFIG["min_match_ratio"]))
+    best = {
+        entity_id: n
+        for entity_id, n in hits.most_common(SEARCH_CONFIG["max_candidates"])
+        if n >= needed
+    }
+    return best, len(counted)
+
+
+def _load(sql, ids):
+    if not ids:
+        return []
+    marks = ",".join(["%s"] * len(ids))
+    return db.query_all(sql.format(marks=marks), tuple(ids))
+
+
+def _score(hits, n_grams, needle, haystacks):
+    score = hits / n_grams
+    for text in haystacks:
+        if needle and needle in text:
+            score += 1.5 if text.startswith(needle) else 1.0
+            break
+    return score
+
+
+def search(query):
+    """Ranked matches for ``query``: bookings (by exact ID), vehicles, customers.
+
+    Returns a list of dicts with ``kind``, ``score`` and the row's columns,
+    best first, capped at ``SEARCH_CONFIG["max_results"]``.
+    """
+    query = (query or "").strip()
+    results = []
+
+    digits = query.lstrip("#")
+    if digits.isdecimal():
+        bookings = branches.query_all_databases(
+            """SELECT b.booking_id, b.current_status, b.booking_date, br.branch_name,
+                      c.full_name AS customer_name, v.vehicle_number, s.service_name
+               FROM bookings b
+               JOIN branches br ON b.branch_id = br.branch_id
+               JOIN customers c ON b.customer_id = c.customer_id
+               JOIN vehicles v ON b.vehicle_id = v.vehicle_id
+               JOIN services s ON b.service_id = s.service_id
+               WHERE b.booking_id=%s
+               UNION ALL
+               SELECT b.booking_id, b.current_status, b.booking_date, br.branch_name,
+                      c.full_name AS customer_name, v.vehicle_number, s.service_name
+               FROM bookings_archive b
+               JOIN branches br ON b.branch_id = br.branch_id
+               JOIN customers c ON b.customer_id = c.customer_id
+               JOIN vehicles v ON b.vehicle_id = v.vehicle_id
+               JOIN services s ON b.service_id = s.service_id
+               WHERE b.booking_id=%s""",
+            (int(digits), int(digits)),
+        )
+        for booking in bookings:
+            results.append(dict(booking, kind="BOOKING", score=10.0))
+
+    # Plates are indexed as one compacted token, so only the compacted query
+    # can match them; names also match word by word.
+    needle = compact(query)
+    plate_grams = query_grams([needle])
+    name_grams = query_grams(normalize(query)) | plate_grams
+
+    hits, n_grams = _candidates(plate_grams, "VEHICLE")
+    vehicles = _load(
+        """SELECT v.vehicle_id, v.vehicle_number, v.brand, v.model,
+                  c.full_name AS customer_name, c.phone
+           FROM vehicles v
+           JOIN customers c ON v.customer_id = c.customer_id
+           WHERE v.vehicle_id IN ({marks})""",
+        list(hits),
+    )
+    for v in vehicles:
+        score = _score(hits[v["vehicle_id"]], n_grams, needle,
+                       [compact(v["vehicle_number"])])
+        results.append(dict(v, kind="VEHICLE", score=score))
+
+    hits, n_grams = _candidates(name_grams, "CUSTOMER")
+    customers = _load(
+        """SELECT customer_id, full_name, phone, city
+           FROM customers WHERE customer_id IN ({marks})""",
+        list(hits),
+    )
+    for c in customers:
+        score = _score(hits[c["customer_id"]], n_grams, needle,
+                       [compact(c["full_name"]), re.sub(r"\D", "", c["phone"] or "")])
+        results.append(dict(c, kind="CUSTOMER", score=score))
+
+    results.sort(key=lambda r: r["score"], reverse=True)
+    return results[:SEARCH_CONFIG["max_results"]]
+
+
+def open_bookings_for(vehicle_ids):
+    """Active bookings per vehicle id, for showing next to search results.
+
+    Read from every branch database, like the booking-ID lookup in search().
+    """
+    if not vehicle_ids:
+        return {}
+    marks = ",".join(["%s"] * len(vehicle_ids))
+    rows = branches.query_all_databases(
+        f"""SELECT booking_id, vehicle_id, current_status, booking_date
+            FROM bookings
+            WHERE vehicle_id IN ({marks})
+              AND current_status NOT IN ('DELIVERED','CANCELLED')""",
+        tuple(vehicle_ids),
+        sort_key=lambda r: r["booking_date"],
+        reverse=True,
+    )
+    by_vehicle = {}
+    for r in rows:
+        by_vehicle.setdefault(r["vehicle_id"], []).append(r)
+    return by_vehicle
+
+
+def rebuild():
+    """Re-index every vehicle and customer, batch by batch."""
+    batch = SEARCH_CONFIG["rebuild_batch_size"]
+    db.execute("DELETE FROM search_grams")
+    total = 0
+    for sql, entity_type, key, tokens in (
+        ("SELECT vehicle_id, vehicle_number FROM vehicles WHERE vehicle_id>%s ORDER BY vehicle_id LIMIT %s",
+         "VEHICLE", "vehicle_id", lambda r: _vehicle_tokens(r["vehicle_number"])),
+        ("SELECT customer_id, full_name, phone FROM customers WHERE customer_id>%s ORDER BY customer_id LIMIT %s",
+         "CUSTOMER", "customer_id", lambda r: _customer_tokens(r["full_name"], r["phone"])),
+    ):
+        last_id = 0
+        while True:
+            rows = db.query_all(sql, (last_id, batch), primary=True)
+            if not rows:
+                break
+            params = [(g, entity_type, r[key]) for r in rows for g in index_grams(tokens(r))]
+            if params:
+                db.execute_many(
+                    "INSERT IGNORE INTO search_grams (gram, entity_type, entity_id) VALUES (%s,%s,%s)",
+                    params,
+                )
+            total += len(rows)
+            last_id = rows[-1][key]
+    print(f"[SEARCH] Indexed {total} vehicles and customers")
+    return total
+
+
+if __name__ == "__main__":
+    rebuild()
@@ -0,0 +1,98 @@
+"""Benchmark for the trigram search index at realistic sizes.
+
+Fills a scratch copy of ``search_grams`` (``search_grams_bench``) in the
+configured database with synthetic plates and customer names, then times the
+index lookup of ``search._candidates`` for a mix of selective and very
+common queries:
+
+    python -m server.searchbench [entities]     # default 1000000
+
+The scratch table is dropped afterwards unless ``--keep`` is given, in which
+case a later run with the same size reuses it.
+"""
+
+import random
+import sys
+import time
+
+from . import db, search
+
+TABLE = "search_grams_bench"
+STATES = ("MH", "KA", "DL", "TN", "GJ")
+FIRST = ("Ravi", "Anita", "Suresh", "Priya", "Amit", "Neha", "Vikram", "Sunita", "Rahul", "Kavya")
+LAST = ("Kumar", "Sharma", "Patel", "Reddy", "Iyer", "Singh", "Gupta", "Nair", "Joshi", "Das")
+
+QUERIES = (
+    "MH12AB1234",     # full plate
+    "ab 12",          # partial plate
+    "1234",           # plate digits, very common
+    "mh",             # state prefix only: every gram is common
+    "ravi kum",       # partial name
+    "sharma",         # common surname
+    "98450",          # phone prefix
+)
+
+
+def _plate(rng):
+    return (f"{rng.choice(STATES)}{rng.randint(1, 50):02d}"
+            f"{rng.choice('ABCDEFGHJK')}{rng.choice('ABCDEFGHJK')}{rng.randint(1, 9999):04d}")
+
+
+def fill(n, batch=5000, seed=7):
+    rng = random.Random(seed)
+    db.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} LIKE search_grams")
+    have = db.query_one(f"SELECT COUNT(DISTINCT entity_type, entity_id) AS n FROM {TABLE}", primary=True)
+    if have and have["n"] == n:
+        print(f"[BENCH] Reusing {TABLE} with {n} entities")
+        return
+    db.execute(f"TRUNCATE TABLE {TABLE}")
+    started = time.perf_counter()
+    params = []
+    for i in range(1, n + 1):
+        if i % 2:
+            grams = search.index_grams(search._vehicle_tokens(_plate(rng)))
+            params += [(g, "VEHICLE", i) for g in grams]
+        else:
+            name = f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+            phone = f"9{rng.randint(100000000, 999999999)}"
+            grams = search.index_grams(search._customer_tokens(name, phone))
+            params += [(g, "CUSTOMER", i) for g in grams]
+        if len(params) >= batch or i == n:
+            db.execute_many(
+                f"INSERT IGNORE INTO {TABLE} (gram, entity_type, entity_id) VALUES (%s,%s,%s)", params
+            )
+            params = []
+    print(f"[BENCH] Indexed {n} entities in {time.perf_counter() - started:.1f}s")
+
+
+def run(repeat=20):
+    print(f"{'query':<14}{'type':<10}{'grams':>6}{'counted':>8}{'found':>7}{'p50 ms':>9}{'p95 ms':>9}")
+    for query in QUERIES:
+        plate_grams = search.query_grams([search.compact(query)])
+        name_grams = search.query_grams(search.normalize(query)) | plate_grams
+        for entity_type, grams in (("VEHICLE", plate_grams), ("CUSTOMER", name_grams)):
+            times = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                hits, counted = search._candidates(grams, entity_type, table=TABLE)
+                times.append((time.perf_counter() - started) * 1000)
+            times.sort()
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            print(f"{query:<14}{entity_type:<10}{len(grams):>6}{counted:>8}{len(hits):>7}"
+                  f"{times[len(times) // 2]:>9.2f}{p95:>9.2f}")
+
+
+def main(argv):
+    keep = "--keep" in argv
+    args = [a for a in argv if a != "--keep"]
+    n = int(args[0]) if args else 1000000
+    fill(n)
+    try:
+        run()
+    finally:
+        if not keep:
+            db.execute(f"DROP TABLE {TABLE}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+"""Background job handlers run by the worker process (``python -m server.jobs``).
+
+Views only enqueue these; nothing here runs on the request path. Payloads
+carry the ``branch_id`` of the booking so the handler reads the right
+database.
+"""
+
+from . import db, jobs
+
+
+@jobs.handler("booking_confirmation")
+def booking_confirmation(payload):
+    with db.branch(payload.get("branch_id")):
+        _booking_confirmation(payload)
+
+
+def _booking_confirmation(payload):
+    booking = db.query_one(
+        """SELECT b.booking_id, s.service_name, v.vehicle_number,
+                  t.slot_date, t.start_time, u.email
+           FROM bookings b
+           JOIN services s ON b.service_id = s.service_id
+           JOIN vehicles v ON b.vehicle_id = v.vehicle_id
+           JOIN time_slots t ON b.slot_id = t.slot_id
+           JOIN customers c ON b.customer_id = c.customer_id
+           JOIN users u ON c.user_id = u.user_id
+           WHERE b.booking_id=%s""",
+        (payload["booking_id"],),
+        primary=True,
+    )
+    if not booking:
+        raise LookupError(f"Booking {payload['booking_id']} not found")
+    # Placeholder for the real mail/SMS gateway
+    print(
+        f"[JOBS] Booking #{booking['booking_id']} confirmed for {booking['email']}: "
+        f"{booking['service_name']} on {booking['vehicle_number']}, "
+        f"{booking['slot_date']} {booking['start_time']}"
+    )
+
+
+@jobs.handler("payment_receipt")
+def payment_receipt(payload):
+    with db.branch(payload.get("branch_id")):
+        _payment_receipt(payload)
+
+
+def _payment_receipt(payload):
+    payment = db.query_one(
+        """SELECT p.payment_id, p.booking_id, p.amount, p.payment_mode,
+                  p.payment_status, u.email
+           FROM payments p
+           JOIN bookings b ON p.booking_id = b.booking_id
+           JOIN customers c ON b.customer_id = c.customer_id
+           JOIN users u ON c.user_id = u.user_id
+           WHERE p.payment_id=%s""",
+        (payload["payment_id"],),
+        primary=True,
+    )
+    if not payment:
+        raise LookupError(f"Payment {payload['payment_id']} not found")
+    print(
+        f"[JOBS] Receipt for payment #{payment['payment_id']} (booking #{payment['booking_id']}) "
+        f"sent to {payment['email']}: {payment['amount']} via {payment['payment_mode']}, "
+        f"{payment['payment_status']}"
+    )
@@ -1,5 +1,10 @@
 -- SQL schema for Car Service and Booking System
 
+DROP TABLE IF EXISTS search_grams;
+DROP TABLE IF EXISTS booking_events;
+DROP TABLE IF EXISTS feedback_archive;
+DROP TABLE IF EXISTS payments_archive;
+DROP TABLE IF EXISTS bookings_archive;
 DROP TABLE IF EXISTS mechanic_services;
 DROP TABLE IF EXISTS feedback;
 DROP TABLE IF EXISTS payments;
@@ -10,6 +15,17 @@ DROP TABLE IF EXISTS vehicles;
 DROP TABLE IF EXISTS mechanics;
 DROP TABLE IF EXISTS customers;
 DROP TABLE IF EXISTS users;
+DROP TABLE IF EXISTS branches;
+
+-- Garages run from this deployment. time_slots, mechanics and bookings
+-- (and through bookings: payments, feedback, booking events) belong to one
+-- branch; users, customers, vehicles and services are shared by all.
+CREATE TABLE branches (
+    branch_id INT AUTO_INCREMENT PRIMARY KEY,
+    branch_name VARCHAR(100) NOT NULL,
+    city VARCHAR(50),
+    is_active TINYINT(1) DEFAULT 1
+);
 
 CREATE TABLE users (
     user_id INT AUTO_INCREMENT PRIMARY KEY,
@@ -39,7 +55,10 @@ CREATE TABLE mechanics (
     specialization VARCHAR(100),
     is_active TINYINT(1) DEFAULT 1,
     join_date DATE,
-    CONSTRAINT fk_mechanics_user FOREIGN KEY (user_id) REFERENCES users(user_id)
+    branch_id INT NOT NULL DEFAULT 1,
+    INDEX idx_mechanics_branch (branch_id, is_active),
+    CONSTRAINT fk_mechanics_user FOREIGN KEY (user_id) REFERENCES users(user_id),
+    CONSTRAINT fk_mechanics_branch FOREIGN KEY (branch_id) REFERENCES branches(branch_id)
 );
 
 CREATE TABLE vehicles (
@@ -68,7 +87,10 @@ CREATE TABLE time_slots (
     slot_date DATE NOT NULL,
     start_time TIME NOT NULL,
     end_time TIME NOT NULL,
-    max_bookings INT NOT NULL
+    max_bookings INT NOT NULL,
+    branch_id INT NOT NULL DEFAULT 1,
+    INDEX idx_time_slots_branch_date (branch_id, slot_date, start_time),
+    CONSTRAINT fk_time_slots_branch FOREIGN KEY (branch_id) REFERENCES branches(branch_id)
 );
 
 CREATE TABLE bookings (
@@ -81,11 +103,17 @@ CREATE TABLE bookings (
     booking_date DATETIME DEFAULT CURRENT_TIMESTAMP,
     current_status ENUM('BOOKED','IN_PROGRESS','WAITING_FOR_PARTS','COMPLETED','DELIVERED','CANCELLED') NOT NULL DEFAULT 'BOOKED',
     remarks TEXT,
+    branch_id INT NOT NULL DEFAULT 1,
+    INDEX idx_bookings_status_date (current_status, booking_date),
+    INDEX idx_bookings_mechanic_status (assigned_mechanic_id, current_status),
+    INDEX idx_bookings_branch_date (branch_id, booking_date),
+    INDEX idx_bookings_branch_status (branch_id, current_status, booking_date),
     CONSTRAINT fk_bookings_customer FOREIGN KEY (customer_id) REFERENCES customers(customer_id),
     CONSTRAINT fk_bookings_vehicle FOREIGN KEY (vehicle_id) REFERENCES vehicles(vehicle_id),
     CONSTRAINT fk_bookings_service FOREIGN KEY (service_id) REFERENCES services(service_id),
     CONSTRAINT fk_bookings_slot FOREIGN KEY (slot_id) REFERENCES time_slots(slot_id),
-    CONSTRAINT fk_bookings_mechanic FOREIGN KEY (assigned_mechanic_id) REFERENCES mechanics(mechanic_id)
+    CONSTRAINT fk_bookings_mechanic FOREIGN KEY (assigned_mechanic_id) REFERENCES mechanics(mechanic_id),
+    CONSTRAINT fk_bookings_branch FOREIGN KEY (branch_id) REFERENCES branches(branch_id)
 );
 
 CREATE TABLE payments (
@@ -119,6 +147,82 @@ CREATE TABLE mechanic_services (
     CONSTRAINT fk_mechserv_service FOREIGN KEY (service_id) REFERENCES services(service_id)
 );
 
+-- Append-only status history, written in batches by server/events.py.
+-- No foreign key to bookings: events outlive the move to bookings_archive.
+CREATE TABLE booking_events (
+    event_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    booking_id INT NOT NULL,
+    new_status ENUM('BOOKED','IN_PROGRESS','WAITING_FOR_PARTS','COMPLETED','DELIVERED','CANCELLED') NOT NULL,
+    remarks TEXT,
+    actor_user_id INT,
+    actor_role ENUM('ADMIN','CUSTOMER','MECHANIC'),
+    created_at DATETIME(3) NOT NULL,
+    INDEX idx_booking_events_booking (booking_id, created_at),
+    INDEX idx_booking_events_status (new_status, created_at)
+);
+
+-- Trigram index for admin search, maintained by server/search.py.
+-- Vehicle numbers and customer names / phones are normalised (lowercase,
+-- punctuation removed) and each token is padded with '$' before splitting
+-- into 3-character grams.
+CREATE TABLE search_grams (
+    gram VARCHAR(3) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+    entity_type ENUM('VEHICLE','CUSTOMER') NOT NULL,
+    entity_id INT NOT NULL,
+    PRIMARY KEY (gram, entity_type, entity_id),
+    INDEX idx_search_grams_entity (entity_type, entity_id)
+);
+
+-- Archive (cold) tables for closed bookings.
+-- server/archive.py moves DELIVERED/CANCELLED bookings older than
+-- ARCHIVE_CONFIG["min_age_days"] here together with their payments and
+-- feedback, so the active tables above only hold recent / open work.
+-- No foreign keys: rows are copied as-is and never updated afterwards.
+
+CREATE TABLE bookings_archive (
+    booking_id INT PRIMARY KEY,
+    customer_id INT NOT NULL,
+    vehicle_id INT NOT NULL,
+    service_id INT NOT NULL,
+    slot_id INT NOT NULL,
+    assigned_mechanic_id INT,
+    booking_date DATETIME,
+    current_status ENUM('BOOKED','IN_PROGRESS','WAITING_FOR_PARTS','COMPLETED','DELIVERED','CANCELLED') NOT NULL,
+    remarks TEXT,
+    branch_id INT NOT NULL DEFAULT 1,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_bookings_archive_mechanic (assigned_mechanic_id, current_status, booking_date),
+    INDEX idx_bookings_archive_customer (customer_id, booking_date),
+    INDEX idx_bookings_archive_branch (branch_id, booking_date),
+    INDEX idx_bookings_archive_slot (slot_id)
+);
+
+CREATE TABLE payments_archive (
+    payment_id INT PRIMARY KEY,
+    booking_id INT NOT NULL,
+    amount DECIMAL(10,2) NOT NULL,
+    payment_mode ENUM('CASH','CARD','UPI','ONLINE') NOT NULL,
+    payment_status ENUM('PENDING','PAID','FAILED') NOT NULL,
+    payment_date DATETIME,
+    transaction_ref VARCHAR(100),
+    INDEX idx_payments_archive_booking (booking_id),
+    INDEX idx_payments_archive_date (payment_date)
+);
+
+CREATE TABLE feedback_archive (
+    feedback_id INT PRIMARY KEY,
+    booking_id INT NOT NULL,
+    customer_id INT NOT NULL,
+    rating INT NOT NULL,
+    comments TEXT,
+    created_at DATETIME,
+    INDEX idx_feedback_archive_booking (booking_id),
+    INDEX idx_feedback_archive_created (created_at)
+);
+
+-- Default branch; existing single-garage data belongs to it
+INSERT INTO branches (branch_id, branch_name, city) VALUES (1, 'Main Branch', NULL);
+
 -- Default admin user (email: admin@example.com, password: admin123)
 INSERT INTO users (email, password_hash, role)
 VALUES ('admin@example.com', SHA2('admin123', 256), 'ADMIN');